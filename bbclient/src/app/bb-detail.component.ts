@@ -20,8 +20,17 @@ export class BbDetailComponent implements OnInit {
               private ar: ActivatedRoute) { }
 
   getComments() {
-    this.bbservice.getComments(this.bb.id).subscribe(
-        (comments: Object[]) => {this.comments = comments;}
+    // Запрашиваются только новые комментарии; полная страница означает,
+    // что за ней могут быть еще
+    const last = this.comments.length ?
+                 this.comments[this.comments.length - 1].id : 0;
+    this.bbservice.getNewComments(this.bb.id, last).subscribe(
+        (comments: any[]) => {
+            this.comments = this.comments.concat(comments);
+            if (comments.length == this.bbservice.commentsPageSize) {
+                this.getComments();
+            }
+        }
     );
   }
 
@@ -1,7 +1,7 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { Observable, of } from 'rxjs';
-import { catchError } from 'rxjs/operators';
+import { catchError, map, switchMap } from 'rxjs/operators';
 import { HttpHeaders } from '@angular/common/http';
 
 @Injectable({
@@ -9,6 +9,11 @@ import { HttpHeaders } from '@angular/common/http';
 })
 export class BbService {
   private url: String = 'http://localhost:8000/api/';
+  // Наибольшее число комментариев в ответе на getNewComments()
+  readonly commentsPageSize: number = 100;
+  // Ключи API, полученные через api/login/: пароль отправляется
+  // серверу только при первом комментарии пользователя
+  private tokens: Map<String, string> = new Map();
 
   constructor(private http: HttpClient) { }
 
@@ -27,24 +32,55 @@ export class BbService {
     }
   }
 
+  login(username: String, password: String): Observable<string> {
+    const token = this.tokens.get(username);
+    if (token) {
+      return of(token);
+    }
+    return this.http.post<any>(`${this.url}login/`,
+      {'username': username, 'password': password}).pipe(
+        map((response: any) => {
+          this.tokens.set(username, response.token);
+          return response.token;
+        })
+      );
+  }
+
   addComment(bb: String, author: String, password: String,
     content: String): Observable<Object>
   {
     const comment = {'bb': bb, 'author': author, 'content': content};
-    const options = {
-      headers: new HttpHeaders(
-        {
-          'Content-Type': 'application/json',
-          'Authorization': 'Basic ' + window.btoa(author + ':' +
-                            password)
+    return this.login(author, password).pipe(
+      switchMap((token: string) => {
+        const options = {
+          headers: new HttpHeaders(
+            {
+              'Content-Type': 'application/json',
+              'Authorization': 'Token ' + token
+            }
+          )
+        };
+        return this.http.post<Object>(`${this.url}bbs/${bb}/comments/`,
+                                      comment, options);
+      }),
+      catchError((error: any) => {
+        // Ключ удален на сервере -- при следующей попытке нужен вход
+        if (error.status == 401) {
+          this.tokens.delete(author);
         }
-      )
-    };
-    return this.http.post<Object>(`${this.url}bbs/${bb}/comments/`, comment,
-                options).pipe(catchError(this.handleError()));
+        return this.handleError()(error);
+      })
+    );
   }
 
   getComments(pk: Number): Observable<Object[]> {
     return this.http.get<Object[]>(`${this.url}bbs/${pk}/comments/`);
   }
+
+  // Только комментарии, добавленные после комментария sinceId
+  getNewComments(pk: Number, sinceId: Number): Observable<any[]> {
+    return this.http.get<any[]>(`${this.url}bbs/${pk}/comments/`,
+      {params: {since_id: String(sinceId),
+                limit: String(this.commentsPageSize)}});
+  }
 }
@@ -0,0 +1,115 @@
+from calendar import timegm
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import replace_query_param
+
+from main.models import Bb
+from main.pagination import CursorPaginator
+from main.conditional import aget_bbs_state, aget_bb_updated_at, \
+     api_bbs_etag, api_bbs_last_modified, api_bb_etag, api_bb_last_modified
+from .serializers import BbSerializer, BbDetailSerializer, \
+     CommentSerializer
+from . import views
+
+# Асинхронные варианты представлений из views.py для запуска под ASGI
+# (включаются настройкой API_ASYNC_VIEWS). Записи выбираются
+# асинхронным ORM, а сериализуются уже выбранные объекты, без запросов
+# к базе. Ответы те же, что у синхронных представлений, но только в JSON.
+# В Django 4.2 декоратор condition не поддерживает асинхронные
+# представления, поэтому условные запросы проверяются здесь
+
+
+def render(data, status=200, headers=None):
+    return HttpResponse(JSONRenderer().render(data), status=status,
+                        headers=headers, content_type='application/json')
+
+
+def conditional(request, etag, last_modified):
+    # Возвращает ответ 304 (412) или None и значения для заголовков
+    etag = quote_etag(etag) if etag else None
+    if last_modified:
+        last_modified = timegm(last_modified.utctimetuple())
+    validators = (etag, last_modified)
+    return get_conditional_response(request, etag=etag,
+                                    last_modified=last_modified), validators
+
+
+def finish(response, validators):
+    etag, last_modified = validators
+    if etag and not response.has_header('ETag'):
+        response.headers['ETag'] = etag
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+async def bbs(request):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET'])
+    await aget_bbs_state(request)
+    response, validators = conditional(request, api_bbs_etag(request),
+                                       api_bbs_last_modified(request))
+    if response:
+        return finish(response, validators)
+    paginator = CursorPaginator(Bb.objects.filter(is_active=True), 10)
+    page = await paginator.aget_page(request.GET.get('cursor'))
+    links = []
+    for rel, cursor in (('next', page.next_cursor),
+                        ('prev', page.previous_cursor)):
+        if cursor:
+            url = replace_query_param(request.build_absolute_uri(),
+                                      'cursor', cursor)
+            links.append(f'<{url}>; rel="{rel}"')
+    headers = {'Link': ', '.join(links)} if links else {}
+    if 'count' in request.GET:
+        headers['X-Total-Count'] = str(await paginator.acount())
+    data = BbSerializer(page.object_list, many=True).data
+    return finish(render(data, headers=headers), validators)
+
+
+async def bb_detail(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET'])
+    await aget_bb_updated_at(request, pk)
+    response, validators = conditional(request, api_bb_etag(request, pk),
+                                       api_bb_last_modified(request, pk))
+    if response:
+        return finish(response, validators)
+    bb = await Bb.objects.filter(is_active=True, pk=pk).afirst()
+    if bb is None:
+        # Тот же текст, что у get_object_or_404 в RetrieveAPIView
+        return finish(render({'detail': 'No %s matches the given query.'
+                              % Bb._meta.object_name}, status=404),
+                      validators)
+    return finish(render(BbDetailSerializer(bb).data), validators)
+
+
+async def comments(request, pk):
+    if request.method == 'POST':
+        # Запись, проверка пользователя и CSRF -- в синхронном
+        # представлении DRF (как и раньше)
+        return await sync_to_async(views.comments)(request, pk)
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'POST'])
+    await aget_bb_updated_at(request, pk)
+    response, validators = conditional(request, api_bb_etag(request, pk),
+                                       api_bb_last_modified(request, pk))
+    if response:
+        return finish(response, validators)
+    comments, paged, errors = views.filter_comments(request.GET, pk)
+    if errors:
+        return finish(render(errors, status=400), validators)
+    comments = [comment async for comment in comments]
+    data = CommentSerializer(comments, many=True).data
+    headers = views.comments_headers(request, comments) if paged else None
+    return finish(render(data, headers=headers), validators)
+
+
+# csrf_exempt в Django 4.2 превращает асинхронное представление в
+# синхронное; CSRF все равно проверяет DRF в views.comments
+comments.csrf_exempt = True
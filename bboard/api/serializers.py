@@ -17,4 +17,4 @@ class BbDetailSerializer(serializers.ModelSerializer):
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = ('bb', 'author', 'content', 'created_at')
+        fields = ('id', 'bb', 'author', 'content', 'created_at')
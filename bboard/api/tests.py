@@ -1,3 +1,202 @@
-from django.test import TestCase
+import base64
+import os
+import subprocess
+import sys
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.urls import clear_url_caches, resolve
+
+from main.tests import QueryBudgetTestCase
+
+from . import async_views
+
+
+class ApiQueryBudgetTests(QueryBudgetTestCase):
+    BUDGETS = {
+        'bbs': 2,
+        'bb_detail': 2,
+        'comments_get': 2,
+        'comments_since': 2,
+        'comments_post': 7,
+        'search': 1,
+        'export': 2,
+        'login': 2,
+        'comments_post_token': 7,
+    }
+
+    def test_bbs(self):
+        self.assertQueryBudget('bbs', '/api/bbs/')
+
+    def test_bb_detail(self):
+        self.assertQueryBudget('bb_detail', lambda: f'/api/bbs/{self.bb.pk}/')
+
+    def test_comments_get(self):
+        self.assertQueryBudget('comments_get',
+                               lambda: f'/api/bbs/{self.bb.pk}/comments/')
+
+    def test_comments_since(self):
+        self.assertQueryBudget(
+            'comments_since',
+            lambda: f'/api/bbs/{self.bb.pk}/comments/?since_id=0&limit=3')
+
+    def test_comments_post(self):
+        self.assertQueryBudget(
+            'comments_post', lambda: f'/api/bbs/{self.bb.pk}/comments/',
+            method='post', user=self.user,
+            data=lambda: {'bb': self.bb.pk, 'author': 'owner', 'content': 'Отзыв'})
+
+    def test_search(self):
+        self.assertQueryBudget('search', '/api/search/?q=велосипед')
+
+    def test_export(self):
+        self.assertQueryBudget('export', '/api/bbs/export/?type=csv',
+                               user=self.user)
+
+    def test_export_gzip(self):
+        self.grow(1)
+        self.client.force_login(self.user)
+        for accept_encoding, gzip in (('gzip, deflate', True),
+                                      ('deflate, GZIP;q=0.5', True),
+                                      ('gzip;q=0', False),
+                                      ('gzip; q=0.0, identity', False),
+                                      ('x-gzip-foo', False),
+                                      ('', False)):
+            response = self.client.get(
+                '/api/bbs/export/',
+                headers={'Accept-Encoding': accept_encoding})
+            self.assertEqual(response.get('Content-Encoding') == 'gzip', gzip,
+                             accept_encoding)
+            self.assertIn('Accept-Encoding', response['Vary'])
+            b''.join(response.streaming_content)
+
+    def test_login(self):
+        self.assertQueryBudget('login', '/api/login/', method='post',
+                               data={'username': 'owner',
+                                     'password': 'password'})
+
+    def test_responses(self):
+        self.grow(6)
+        response = self.client.get('/api/bbs/?count=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 6)
+        self.assertEqual(response['X-Total-Count'], '6')
+        url = f'/api/bbs/{self.bb.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.json()['id'], self.bb.pk)
+        response = self.client.get(
+            url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/api/bbs/0/').status_code, 404)
+        url = f'/api/bbs/{self.bb.pk}/comments/'
+        response = self.client.get(url + '?since_id=0&limit=2')
+        self.assertEqual(len(response.json()), 2)
+        self.assertIn('rel="next"', response['Link'])
+        response = self.client.get(url + '?since_id=x&limit=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'since_id', 'limit'})
+        response = self.client.post(url, {'bb': self.bb.pk, 'author': 'Гость',
+                                          'content': 'Отзыв'})
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_token_auth(self):
+        response = self.client.post('/api/login/', {'username': 'owner',
+                                                    'password': 'wrong'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/login/', {'username': 'owner',
+                                                    'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        token = 'Token ' + response.json()['token']
+        self.client.defaults['HTTP_AUTHORIZATION'] = token
+        self.assertQueryBudget(
+            'comments_post_token', lambda: f'/api/bbs/{self.bb.pk}/comments/',
+            method='post', data=lambda: {'bb': self.bb.pk, 'author': 'owner',
+                                         'content': 'Отзыв'})
+        self.assertEqual(self.client.get('/api/bbs/export/').status_code, 200)
+        # Пароль в каждом запросе больше не принимается
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Basic ' + \
+            base64.b64encode(b'owner:password').decode()
+        self.assertIn(self.client.get('/api/bbs/export/').status_code,
+                      (401, 403))
+        self.client.defaults['HTTP_AUTHORIZATION'] = token
+        self.assertEqual(self.client.post('/api/logout/').status_code, 204)
+        self.assertEqual(self.client.get('/api/bbs/export/').status_code, 401)
+
+
+def reload_urls():
+    # Набор представлений API выбирается при импорте api.urls
+    for name in ('api.urls', settings.ROOT_URLCONF):
+        sys.modules.pop(name, None)
+    clear_url_caches()
+
+
+async def wait(awaitable):
+    return await awaitable
+
+
+class AsyncClientAdapter:
+    # Синхронные get(), post() и т. п. поверх AsyncClient, чтобы
+    # выполнить те же проверки; заголовки HTTP_* из defaults
+    # передаются в каждом запросе, как у обычного Client
+    METHODS = {'get', 'post', 'put', 'patch', 'delete', 'head', 'options'}
+
+    def __init__(self, client):
+        self.client = client
+        self.defaults = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name not in self.METHODS:
+            return attr
+
+        def send(path, data=None, headers=None, **extra):
+            request_headers = {key[5:].replace('_', '-'): value
+                               for key, value in self.defaults.items()
+                               if key.startswith('HTTP_')}
+            request_headers.update(headers or {})
+            return async_to_sync(wait)(attr(path, data,
+                                            headers=request_headers, **extra))
+        return send
+
+
+@override_settings(API_ASYNC_VIEWS=True)
+class AsyncApiQueryBudgetTests(ApiQueryBudgetTests):
+    # Те же бюджеты и ответы для асинхронных представлений (под ASGI)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        reload_urls()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        reload_urls()
+
+    def setUp(self):
+        super().setUp()
+        self.client = AsyncClientAdapter(self.async_client)
+
+    def test_async_views(self):
+        self.assertIs(resolve('/api/bbs/').func, async_views.bbs)
+
+
+class AsgiEntrypointTests(SimpleTestCase):
+    # Настройки читаются один раз при запуске, поэтому точка входа
+    # проверяется в отдельном процессе
+    def test_asgi_selects_async_views(self):
+        code = ('import bboard.asgi\n'
+                'from django.conf import settings\n'
+                'from django.urls import resolve\n'
+                'func = resolve("/api/bbs/").func\n'
+                'print(func.__module__, func.__name__, '
+                'settings.DATABASES["default"]["CONN_MAX_AGE"], '
+                'settings.DATABASES["readonly"]["CONN_MAX_AGE"])')
+        env = {key: value for key, value in os.environ.items()
+               if key != 'BBOARD_ASGI'}
+        env['DJANGO_SETTINGS_MODULE'] = 'bboard.settings'
+        output = subprocess.run(
+            [sys.executable, '-c', code], env=env, check=True, text=True,
+            cwd=settings.BASE_DIR, capture_output=True).stdout
+        self.assertEqual(output.split(), ['api.async_views', 'bbs', '0', '0'])
@@ -1,9 +1,25 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import bbs, BbDetailView, comments
+from .views import bbs, BbDetailView, comments, search, export, \
+     LoginView, logout
+from . import async_views
+
+# Под ASGI (bboard/asgi.py) список, объявление и комментарии
+# обслуживаются асинхронными представлениями
+if settings.API_ASYNC_VIEWS:
+    bbs = async_views.bbs
+    bb_detail = async_views.bb_detail
+    comments = async_views.comments
+else:
+    bb_detail = BbDetailView.as_view()
 
 urlpatterns = [
     path('bbs/<int:pk>/comments/', comments),
-    path('bbs/<int:pk>/', BbDetailView.as_view()),
+    path('bbs/<int:pk>/', bb_detail),
+    path('bbs/export/', export),
     path('bbs/', bbs),
+    path('search/', search),
+    path('login/', LoginView.as_view()),
+    path('logout/', logout),
 ]
@@ -1,27 +1,195 @@
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, \
      permission_classes
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.generics import RetrieveAPIView
 from rest_framework.status import HTTP_201_CREATED, \
-     HTTP_400_BAD_REQUEST
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+     HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST
+from rest_framework.permissions import IsAuthenticated, \
+     IsAuthenticatedOrReadOnly
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.utils.urls import replace_query_param, \
+     remove_query_param
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 from main.models import Bb, Comment
+from main.search import search_bbs
+from main.pagination import CursorPaginator
+from main.export import FORMATS, get_export_queryset, export_bbs, \
+     parse_moment
+from main.conditional import api_bbs_etag, api_bbs_last_modified, \
+     api_bb_etag, api_bb_last_modified
 from .serializers import BbSerializer, BbDetailSerializer, \
      CommentSerializer
 
+# Клиент должен перепроверять ответ при каждом опросе (получая 304,
+# если данные не изменились), а не брать его из кэша браузера
+revalidate = cache_control(no_cache=True)
+
+# Наибольшее число комментариев в ответе с since_id / since / limit
+COMMENTS_PAGE_SIZE = 100
+
+def filter_comments(params, pk):
+    # Без параметров -- все комментарии, как раньше. С since_id (ключ
+    # последнего полученного комментария), since (дата и время) или limit --
+    # только более новые, не больше limit, по порядку ключей: каждый опрос
+    # проходит лишь по новым записям индекса main_comment_bb_active_id.
+    # Возвращает набор записей, признак постраничного ответа и ошибки
+    comments = Comment.objects.filter(is_active=True, bb=pk)
+    if not any(key in params for key in ('since_id', 'since', 'limit')):
+        return comments, False, {}
+    errors = {}
+    since_id = params.get('since_id', '0')
+    if not since_id.isdigit():
+        errors['since_id'] = ['Нужен ключ комментария']
+    limit = params.get('limit', str(COMMENTS_PAGE_SIZE))
+    if not limit.isdigit() or not 0 < int(limit) <= COMMENTS_PAGE_SIZE:
+        errors['limit'] = [f'Нужно число от 1 до {COMMENTS_PAGE_SIZE}']
+    since = None
+    if params.get('since'):
+        since = parse_datetime(params['since'])
+        if since is None:
+            errors['since'] = ['Нужны дата и время в ISO 8601']
+        elif timezone.is_naive(since):
+            since = timezone.make_aware(since)
+    if errors:
+        return None, True, errors
+    comments = comments.filter(pk__gt=since_id).order_by('pk')
+    if since:
+        comments = comments.filter(created_at__gt=since)
+        if 'since_id' not in params:
+            comments = comments.order_by('created_at', 'pk')
+    return comments[:int(limit)], True, {}
+
+def comments_headers(request, comments):
+    # Ссылка для следующего опроса: since_id -- ключ последнего
+    # полученного комментария (или прежний, если новых нет)
+    if comments:
+        since_id = comments[-1].pk
+    else:
+        since_id = request.GET.get('since_id', '0')
+    url = remove_query_param(request.build_absolute_uri(), 'since')
+    url = replace_query_param(url, 'since_id', since_id)
+    return {'Link': f'<{url}>; rel="next"'}
+
+@revalidate
+@condition(etag_func=api_bbs_etag, last_modified_func=api_bbs_last_modified)
 @api_view(['GET'])
 def bbs(request):
     if request.method == 'GET':
-        bbs = Bb.objects.filter(is_active=True)[:10]
-        serializer = BbSerializer(bbs, many=True)
-        return Response(serializer.data)
+        paginator = CursorPaginator(Bb.objects.filter(is_active=True), 10)
+        page = paginator.get_page(request.query_params.get('cursor'))
+        serializer = BbSerializer(page.object_list, many=True)
+        # Тело ответа остается списком (его ждет bbclient), а ссылки
+        # на соседние страницы передаются в заголовке Link
+        links = []
+        for rel, cursor in (('next', page.next_cursor),
+                            ('prev', page.previous_cursor)):
+            if cursor:
+                url = replace_query_param(request.build_absolute_uri(),
+                                          'cursor', cursor)
+                links.append(f'<{url}>; rel="{rel}"')
+        headers = {'Link': ', '.join(links)} if links else None
+        if 'count' in request.query_params:
+            headers = headers or {}
+            headers['X-Total-Count'] = str(paginator.count)
+        return Response(serializer.data, headers=headers)
+
+class LoginView(ObtainAuthToken):
+    # Обменивает имя и пароль на ключ API ({"token": ...}); пароль
+    # проверяется только здесь, число попыток ограничено
+    throttle_classes = (ScopedRateThrottle,)
+    throttle_scope = 'login'
+
+@api_view(['POST'])
+@permission_classes((IsAuthenticated,))
+def logout(request):
+    # Удаляет ключ, с которым выполнен запрос
+    if request.auth is not None:
+        request.auth.delete()
+    return Response(status=HTTP_204_NO_CONTENT)
+
+@api_view(['GET'])
+def search(request):
+    keyword = request.query_params.get('q', '')
+    bbs = Bb.objects.filter(is_active=True)
+    if 'rubric' in request.query_params:
+        bbs = bbs.filter(rubric=request.query_params['rubric'])
+    if keyword:
+        bbs = search_bbs(bbs, keyword, ranked=True)[:20]
+    else:
+        bbs = bbs.none()
+    serializer = BbSerializer(bbs, many=True)
+    return Response(serializer.data)
+
+def accepts_gzip(request):
+    # Accept-Encoding вида «deflate, gzip;q=0.5»; «gzip;q=0» означает,
+    # что сжатие gzip клиент не принимает
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for coding in header.split(','):
+        name, *params = coding.split(';')
+        if name.strip().lower() != 'gzip':
+            continue
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+@api_view(['GET'])
+@permission_classes((IsAuthenticated,))
+def export(request):
+    # Полная выгрузка активных объявлений в NDJSON (type=ndjson) или CSV
+    # (type=csv) с отбором по рубрике и дате публикации (since, until).
+    # Если клиент принимает gzip, ответ сжимается на лету
+    params = request.query_params
+    kind = params.get('type', 'ndjson')
+    errors = {}
+    if kind not in FORMATS:
+        errors['type'] = ['Допустимые значения: ' + ', '.join(FORMATS)]
+    rubric = params.get('rubric')
+    if rubric and not rubric.isdigit():
+        errors['rubric'] = ['Нужен ключ рубрики']
+    moments = {}
+    for name in ('since', 'until'):
+        if params.get(name):
+            moments[name] = parse_moment(params[name], end=name == 'until')
+            if moments[name] is None:
+                errors[name] = ['Нужна дата или дата и время в ISO 8601']
+    if errors:
+        return Response(errors, status=HTTP_400_BAD_REQUEST)
+    queryset = get_export_queryset(rubric, **moments)
+    gzip = accepts_gzip(request)
+    response = StreamingHttpResponse(
+        export_bbs(queryset, kind, gzip),
+        content_type=FORMATS[kind] + '; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="bbs.{kind}"'
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
 
+@method_decorator(revalidate, name='dispatch')
+@method_decorator(condition(etag_func=api_bb_etag,
+                            last_modified_func=api_bb_last_modified),
+                  name='dispatch')
 class BbDetailView(RetrieveAPIView):
     queryset = Bb.objects.filter(is_active=True)
     serializer_class = BbDetailSerializer
 
 
+@revalidate
+@condition(etag_func=api_bb_etag, last_modified_func=api_bb_last_modified)
 @api_view(['GET', 'POST'])
 @permission_classes((IsAuthenticatedOrReadOnly,))
 def comments(request, pk):
@@ -33,6 +201,10 @@ def comments(request, pk):
         else:
             return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
     else:
-        comments = Comment.objects.filter(is_active=True, bb=pk)
+        comments, paged, errors = filter_comments(request.query_params, pk)
+        if errors:
+            return Response(errors, status=HTTP_400_BAD_REQUEST)
+        comments = list(comments)
         serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        headers = comments_headers(request, comments) if paged else None
+        return Response(serializer.data, headers=headers)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bboard.settings')
+# Асинхронные представления API и CONN_MAX_AGE = 0 (см. settings.py)
+os.environ.setdefault('BBOARD_ASGI', '1')
 
 application = get_asgi_application()
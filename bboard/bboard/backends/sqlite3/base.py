@@ -0,0 +1,45 @@
+from django.db.backends.sqlite3 import base
+
+# Параметры соединения по умолчанию; переопределяются ключом
+# 'pragmas' в OPTIONS. WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL не теряет целостности при сбое
+# процесса, busy_timeout заставляет ждать блокировку вместо
+# немедленной ошибки «database is locked»
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Дополнительные ключи OPTIONS:
+    # pragmas -- параметры PRAGMA поверх PRAGMAS;
+    # read_only -- соединение только для чтения (PRAGMA query_only);
+    # transaction_mode -- DEFERRED, IMMEDIATE (по умолчанию) или EXCLUSIVE
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **params.pop('pragmas', {})}
+        self.read_only = params.pop('read_only', False)
+        self.transaction_mode = params.pop('transaction_mode', 'IMMEDIATE')
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.read_only:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # Транзакция записи сразу берет блокировку: иначе при
+        # повышении чтения до записи SQLite не ждет busy_timeout,
+        # а сразу сообщает «database is locked»
+        if self.read_only:
+            self.cursor().execute('BEGIN')
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,105 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+# Чтение в запросах идет через реплики (DATABASE_REPLICAS), запись --
+# через default. После записи клиент получает cookie, и до ее истечения
+# (DATABASE_STICKY_SECONDS) его запросы читают с основной базы: так он
+# сразу видит свои изменения, даже если реплика отстает.
+# Вне запросов (команды, оболочка, фоновые потоки) все идет на default
+
+STICKY_COOKIE = 'db_primary_until'
+
+# Приложения, которые всегда читают с основной базы: капча проверяется
+# сразу после создания, сессия и ключ API -- сразу после входа
+PRIMARY_APPS = {'captcha', 'sessions', 'authtoken'}
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+@contextmanager
+def replica_reads(pinned=False):
+    # Разрешает чтение с реплик; pinned -- читать с основной базы
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        state = _state.get()
+        replicas = [alias for alias in getattr(settings, 'DATABASE_REPLICAS',
+                                               ())
+                    if alias in connections.databases]
+        if state is None or state.pinned or not replicas \
+           or model._meta.app_label in PRIMARY_APPS \
+           or connections['default'].in_atomic_block:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_APPS:
+            state.wrote = state.pinned = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    # Работает и под ASGI, не переводя запрос в отдельный поток
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(self.is_pinned(request)) as state:
+            response = self.get_response(request)
+        return self.process_response(response, state)
+
+    async def __acall__(self, request):
+        with replica_reads(self.is_pinned(request)) as state:
+            response = await self.get_response(request)
+        return self.process_response(response, state)
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def process_response(self, response, state):
+        if state.wrote:
+            seconds = settings.DATABASE_STICKY_SECONDS
+            response.set_cookie(STICKY_COOKIE, str(int(time.time() + seconds)),
+                                max_age=seconds, httponly=True,
+                                samesite='Lax')
+        return response
@@ -49,10 +49,13 @@ INSTALLED_APPS = [
     'easy_thumbnails',
     'captcha',
     'rest_framework',
+    'rest_framework.authtoken',
     'corsheaders',
 ]
 
 MIDDLEWARE = [
+    'main.metrics.MetricsMiddleware',
+    'bboard.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -84,15 +87,92 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'bboard.wsgi.application'
 
+# Тесты не должны трогать общий кэш сайта (см. bboard/testrunner.py)
+TEST_RUNNER = 'bboard.testrunner.TestRunner'
+
 
 # Database
+# Бэкенд bboard.backends.sqlite3 включает WAL и прочие параметры
+# (см. PRAGMAS в нем); соединения живут CONN_MAX_AGE секунд.
+# Чтение в запросах идет через реплики из DATABASE_REPLICAS (см.
+# bboard/routers.py). По умолчанию реплика readonly -- тот же файл,
+# открытый только для чтения (PRAGMA query_only). Для проверки с
+# отдельным файлом укажите в readonly 'NAME': BASE_DIR /
+# 'bboard-replica.sqlite3' и запустите python manage.py replicate_db
+# --interval 1: команда копирует основную базу в файлы реплик.
+# Под ASGI запросы к базе выполняются в отдельном потоке каждого
+# запроса, поэтому постоянные соединения там бесполезны: bboard/asgi.py
+# задает переменную окружения BBOARD_ASGI, и CONN_MAX_AGE становится 0
+ASGI = os.environ.get('BBOARD_ASGI') == '1'
+CONN_MAX_AGE = 0 if ASGI else 600
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'bboard.backends.sqlite3',
+        'NAME': BASE_DIR / 'bboard.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'readonly': {
+        'ENGINE': 'bboard.backends.sqlite3',
         'NAME': BASE_DIR / 'bboard.sqlite3',
-    }
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'read_only': True},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['bboard.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = ['readonly']
+# Сколько секунд после записи клиент читает с основной базы
+DATABASE_STICKY_SECONDS = 10
+
+
+# Cache
+# Кэш должен быть общим для всех рабочих процессов: в нем хранятся
+# версии дерева рубрик и страниц, и изменение, сделанное в одном
+# процессе (или командой manage.py), должно быть видно остальным.
+# Файловый кэш не требует отдельного сервера; при появлении Redis
+# или Memcached достаточно заменить BACKEND и LOCATION
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Версии дерева рубрик и групп страниц. Когда в кэше набирается
+    # MAX_ENTRIES записей, треть из них удаляется случайным образом;
+    # версий же немного (по одной на рубрику), и в отдельном кэше
+    # до этого не доходит
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'versions',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
 
+# Каталог файлов блокировок (main/pagecache.py)
+CACHE_LOCKS_DIR = BASE_DIR / 'cache' / 'locks'
+
+# Сколько секунд хранятся версия и дерево рубрик; страховка на случай,
+# если сигнал об изменении рубрик до кэша не дошел
+RUBRICS_CACHE_TIMEOUT = 3600
+
+# Сколько секунд хранится копия страницы со списком объявлений для
+# посетителей без входа (main/pagecache.py); изменения объявлений
+# и рубрик делают копии устаревшими сразу; 0 отключает кэширование
+PAGE_CACHE_TIMEOUT = 600
+
+# Sessions & messages
+# Сессии читаются из кэша, а в базу записываются только при изменении
+# (вход, выход); с общим кэшем выход сразу действует во всех рабочих
+# процессах. Сообщения хранятся в cookie, так что посетителю без входа
+# сессия не нужна вовсе. Просроченные сессии удаляет команда
+# purge_sessions (по частям, а не одним DELETE, как clearsessions)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -132,11 +212,41 @@ THUMBNAIL_ALIASES = {
     },
 }
 THUMBNAIL_BASEDIR = 'thumbnails'
+# Потоков для фонового создания миниатюр после загрузки изображения
+THUMBNAIL_WORKERS = 2
+
+
+# CAPTCHA: задания берутся из пула, который пополняет команда
+# captcha_pool_worker (например, раз в минуту); она же удаляет
+# просроченные. Если пул пуст, задание создается на месте
+CAPTCHA_GET_FROM_POOL = True
+CAPTCHA_TIMEOUT = 60  # Минут
+# Задания, которым осталось жить меньше, уже не выдаются
+CAPTCHA_GET_FROM_POOL_TIMEOUT = 15  # Минут
 
 
 # CORS
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_URLS_REGEX = r'^/api/.*$'
+# Ссылки на следующую страницу и число записей читает клиент
+CORS_EXPOSE_HEADERS = ['Link', 'X-Total-Count']
+
+# API: вход по ключу, полученному один раз через api/login/ (заголовок
+# «Authorization: Token <ключ>»), или по сессии сайта. Ключ проверяется
+# поиском по первичному ключу таблицы authtoken_token. Basic не
+# используется: с ним пароль хэшируется (PBKDF2) при каждом запросе
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.TokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    # Попыток входа в минуту с одного адреса; счетчики -- в кэше
+    'DEFAULT_THROTTLE_RATES': {'login': '10/min'},
+}
+
+# Асинхронные представления API (api/async_views.py); включаются
+# при запуске через bboard/asgi.py
+API_ASYNC_VIEWS = ASGI
 
 
 # 🔒 🔥 ОТКЛЮЧЕНО всё, связанное с HTTPS (работаем по HTTP)
@@ -165,6 +275,17 @@ else:
     EMAIL_HOST_PASSWORD = 'hghv zeie qvxz fmnf'
 
 
+# 📈 Метрики запросов (/metrics/, формат Prometheus)
+METRICS_ENABLED = False
+# Токен для сборщика метрик: заголовок «Authorization: Bearer <токен>»
+# (без токена метрики доступны только персоналу)
+METRICS_TOKEN = None
+# Запросы дольше этого порога (мс) пишутся в журнал вместе с самыми
+# медленными SQL-запросами; None — не журналировать
+METRICS_SLOW_REQUEST_MS = 1000
+METRICS_SLOW_QUERIES = 3
+
+
 # 📝 Logging
 LOGGING = {
     'version': 1,
@@ -0,0 +1,28 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    # Тесты очищают кэш (cache.clear()) и создают файлы блокировок.
+    # Настоящий файловый кэш из CACHES общий с запущенным сайтом,
+    # поэтому на время тестов он заменяется кэшем в памяти процесса,
+    # а блокировки создаются во временном каталоге
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.locks_dir = tempfile.mkdtemp(prefix='bboard-locks-')
+        self.test_settings = override_settings(
+            CACHES={alias: {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': alias,
+            } for alias in ('default', 'versions')},
+            CACHE_LOCKS_DIR=self.locks_dir,
+        )
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        shutil.rmtree(self.locks_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
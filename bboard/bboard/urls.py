@@ -3,10 +3,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from main.metrics import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('captcha/', include('captcha.urls')),
     path('api/', include('api.urls')),
+    path('metrics/', metrics, name='metrics'),
     path('', include('main.urls')),
 ]
 
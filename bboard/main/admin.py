@@ -1,5 +1,79 @@
+from django import forms
 from django.contrib import admin
-from .models import AdvUser, SuperRubric, SubRubric, Bb, AdditionalImage, Comment, Rating
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import models
+from django.db.models import Max, Min
+from django.utils.functional import cached_property
+
+from .models import AdvUser, SuperRubric, SubRubric, Bb, AdditionalImage, Comment, Rating, \
+     OutgoingMail
+
+
+# ---------- Большие таблицы ----------
+class AutocompleteFilter(admin.FieldListFilter):
+    # Фильтр по внешнему ключу с полем автодополнения вместо списка всех
+    # связанных записей. Варианты подгружает стандартное представление
+    # admin/autocomplete/, поэтому у администратора связанной модели
+    # должны быть заданы search_fields
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin,
+                         field_path)
+        remote_model = field.remote_field.model
+        widget = AutocompleteSelect(field, model_admin.admin_site,
+                                    attrs={'data-width': '100%'})
+        self.rendered_widget = forms.ModelChoiceField(
+            queryset=remote_model._default_manager.all(), widget=widget,
+            required=False).widget.render(self.lookup_kwarg, self.lookup_val)
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        # Ссылка для сценария autocomplete_filter.js: текущий отбор без
+        # этого фильтра
+        self.query_string = changelist.get_query_string(
+            remove=[self.lookup_kwarg])
+        return ()
+
+
+class EstimatedCountPaginator(Paginator):
+    # Без отбора число записей оценивается по диапазону ключей (два
+    # поиска по первичному ключу) вместо COUNT(*) по всей таблице.
+    # Удаленные записи оставляют в диапазоне дыры, так что последние
+    # страницы могут оказаться пустыми
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and \
+                isinstance(query.model._meta.pk, models.AutoField):
+            bounds = self.object_list.aggregate(first=Min('pk'),
+                                                last=Max('pk'))
+            if bounds['first'] is None:
+                return 0
+            return bounds['last'] - bounds['first'] + 1
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Для таблиц, растущих без ограничений
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        return super().media + \
+            AutocompleteSelect(None, self.admin_site).media + \
+            forms.Media(js=['admin/js/jquery.init.js',
+                            'main/admin/autocomplete_filter.js'])
 
 # ---------- AdvUser ----------
 @admin.register(AdvUser)
@@ -20,6 +94,9 @@ class AdvUserAdmin(admin.ModelAdmin):
     readonly_fields = ('last_login', 'date_joined')
     save_on_top = True
 
+    def delete_queryset(self, request, queryset):
+        queryset.bulk_delete()
+
 
 # ---------- Rubrics ----------
 class SubRubricInline(admin.TabularInline):
@@ -46,10 +123,13 @@ class AdditionalImageInline(admin.TabularInline):
 
 # ---------- Bb ----------
 @admin.register(Bb)
-class BbAdmin(admin.ModelAdmin):
+class BbAdmin(LargeTableAdmin):
     list_display = ('title', 'rubric', 'author', 'price', 'is_active', 'created_at')
     list_display_links = ('title',)
-    list_filter = ('is_active', 'rubric', 'author', 'created_at')
+    # __str__ подрубрики выводит и название надрубрики
+    list_select_related = ('rubric__super_rubric', 'author')
+    list_filter = ('is_active', ('rubric', AutocompleteFilter),
+                   ('author', AutocompleteFilter), 'created_at')
     search_fields = ('title', 'content')
     fields = (
         ('title', 'price'),
@@ -64,13 +144,19 @@ class BbAdmin(admin.ModelAdmin):
     inlines = (AdditionalImageInline,)
     save_on_top = True
     date_hierarchy = 'created_at'
+    # Годы, месяцы и дни -- поиском по индексу, без SELECT DISTINCT
+    change_list_template = 'admin/indexed_change_list.html'
+
+    def delete_queryset(self, request, queryset):
+        queryset.bulk_delete()
 
 
 # ---------- Comment ----------
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ('author', 'bb', 'created_at', 'is_active')
-    list_filter = ('is_active', 'created_at')
+    list_select_related = ('bb',)
+    list_filter = ('is_active', ('bb', AutocompleteFilter), 'created_at')
     search_fields = ('author', 'content')
     fields = ('bb', 'author', 'content', 'is_active', 'created_at')
     readonly_fields = ('created_at',)
@@ -78,8 +164,19 @@ class CommentAdmin(admin.ModelAdmin):
 
 # ---------- Rating ----------
 @admin.register(Rating)
-class RatingAdmin(admin.ModelAdmin):
+class RatingAdmin(LargeTableAdmin):
     list_display = ('user', 'bb', 'score', 'created_at')
-    list_filter = ('score', 'created_at')
+    list_select_related = ('user', 'bb')
+    list_filter = ('score', ('user', AutocompleteFilter),
+                   ('bb', AutocompleteFilter), 'created_at')
     search_fields = ('user__username', 'bb__title')
-    readonly_fields = ('created_at',)
\ No newline at end of file
+    readonly_fields = ('created_at',)
+
+
+# ---------- OutgoingMail ----------
+@admin.register(OutgoingMail)
+class OutgoingMailAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'created_at', 'attempts', 'sent_at')
+    list_filter = ('sent_at',)
+    search_fields = ('to', 'subject')
+    readonly_fields = ('created_at',)
@@ -0,0 +1,109 @@
+from hashlib import md5
+
+from django.contrib import messages
+from django.db.models import Count, Max
+
+from .middleware import get_rubrics_version
+from .models import Bb
+
+# Валидаторы для условных GET-запросов (ETag / Last-Modified): вычисляются
+# одним агрегирующим запросом, и при совпадении представление возвращает
+# 304 без выборки записей, вывода шаблона или сериализации
+
+def make_etag(*parts):
+    return md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def get_user_key(request):
+    # HTML-страницы зависят от пользователя (панель навигации, форма
+    # выхода с CSRF-токеном), поэтому он входит в ETag
+    if request.user.is_authenticated:
+        return '%s:%s' % (request.user.pk, request.META.get('CSRF_COOKIE'))
+    return 'anonymous'
+
+def has_messages(request):
+    # len() не помечает сообщения прочитанными
+    return len(messages.get_messages(request)) > 0
+
+def get_bbs_queryset(rubric_pk):
+    bbs = Bb.objects.filter(is_active=True)
+    if rubric_pk is not None:
+        bbs = bbs.filter(rubric=rubric_pk)
+    return bbs
+
+BBS_STATE = {'updated_at': Max('updated_at'), 'last_pk': Max('pk'),
+             'count': Count('pk')}
+
+def get_bbs_state(request, rubric_pk=None):
+    # Результат запоминается в запросе: его используют и ETag,
+    # и Last-Modified
+    states = request.__dict__.setdefault('_bbs_states', {})
+    if rubric_pk not in states:
+        states[rubric_pk] = get_bbs_queryset(rubric_pk).aggregate(**BBS_STATE)
+    return states[rubric_pk]
+
+def get_bb_updated_at(request, pk):
+    states = request.__dict__.setdefault('_bb_states', {})
+    if pk not in states:
+        states[pk] = Bb.objects.filter(pk=pk, is_active=True) \
+                               .values_list('updated_at', flat=True).first()
+    return states[pk]
+
+# Асинхронные варианты заполняют те же сохраненные в запросе значения,
+# после чего функции ETag и Last-Modified ниже обходятся без запросов
+async def aget_bbs_state(request, rubric_pk=None):
+    states = request.__dict__.setdefault('_bbs_states', {})
+    if rubric_pk not in states:
+        states[rubric_pk] = await get_bbs_queryset(rubric_pk) \
+                                      .aaggregate(**BBS_STATE)
+    return states[rubric_pk]
+
+async def aget_bb_updated_at(request, pk):
+    states = request.__dict__.setdefault('_bb_states', {})
+    if pk not in states:
+        states[pk] = await Bb.objects.filter(pk=pk, is_active=True) \
+                                     .values_list('updated_at', flat=True) \
+                                     .afirst()
+    return states[pk]
+
+
+# ---------- HTML-страницы ----------
+def bbs_etag(request, pk=None):
+    if has_messages(request):
+        return None
+    state = get_bbs_state(request, pk)
+    return make_etag('bbs', pk, get_user_key(request), get_rubrics_version(),
+                     state['updated_at'], state['last_pk'], state['count'])
+
+def bb_etag(request, rubric_pk, pk):
+    if request.method not in ('GET', 'HEAD'):
+        # Отправленная форма комментария всегда обрабатывается
+        # представлением, так что ETag не нужен
+        return None
+    if has_messages(request) or 'comment' in request.GET \
+       and not request.user.is_authenticated:
+        # Форма комментария гостя содержит новую CAPTCHA
+        return None
+    updated_at = get_bb_updated_at(request, pk)
+    if updated_at is None:
+        return None
+    return make_etag('bb', pk, get_user_key(request), get_rubrics_version(),
+                     updated_at)
+
+
+# ---------- API ----------
+def api_bbs_etag(request):
+    state = get_bbs_state(request)
+    return make_etag('api-bbs', state['updated_at'], state['last_pk'],
+                     state['count'])
+
+def api_bbs_last_modified(request):
+    return get_bbs_state(request)['updated_at']
+
+def api_bb_etag(request, pk):
+    updated_at = get_bb_updated_at(request, pk)
+    if updated_at is None:
+        return None
+    return make_etag('api-bb', pk, updated_at)
+
+def api_bb_last_modified(request, pk):
+    return get_bb_updated_at(request, pk)
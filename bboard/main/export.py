@@ -0,0 +1,123 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Bb
+
+# Выгрузка активных объявлений целиком (для партнеров). Записи читаются
+# из базы порциями через iterator() и сразу превращаются в строки NDJSON
+# или CSV, так что расход памяти не зависит от числа объявлений
+
+EXPORT_FIELDS = ('id', 'rubric', 'rubric__name', 'title', 'content',
+                 'price', 'contacts', 'image', 'created_at', 'updated_at')
+
+# Заголовок CSV: вместо rubric__name -- rubric_name
+EXPORT_COLUMNS = tuple(field.replace('__', '_') for field in EXPORT_FIELDS)
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CHUNK_SIZE = 2000
+
+# Строки склеиваются в блоки примерно такого размера: и для сжатия,
+# и для сервера это лучше, чем отдавать по строке
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_moment(value, end=False):
+    # Дата (YYYY-MM-DD) или дата и время в ISO 8601; для даты в конце
+    # интервала берется начало следующих суток. Возвращает None, если
+    # значение не разобрано
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime.combine(day, time())
+        if end:
+            moment += timedelta(days=1)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def get_export_queryset(rubric=None, since=None, until=None):
+    # since -- включительно, until -- не включительно. Порядок записей --
+    # как в списках, по индексам main_bb_active и main_bb_rubric_active
+    bbs = Bb.objects.filter(is_active=True)
+    if rubric:
+        bbs = bbs.filter(rubric=rubric)
+    if since:
+        bbs = bbs.filter(created_at__gte=since)
+    if until:
+        bbs = bbs.filter(created_at__lt=until)
+    return bbs.values_list(*EXPORT_FIELDS)
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    # Словари со значениями, готовыми к выводу в JSON и CSV
+    for row in queryset.iterator(chunk_size=chunk_size):
+        item = dict(zip(EXPORT_COLUMNS, row))
+        if item['image']:
+            item['image'] = settings.MEDIA_URL + item['image']
+        item['created_at'] = item['created_at'].isoformat()
+        item['updated_at'] = item['updated_at'].isoformat()
+        yield item
+
+
+def ndjson_lines(rows):
+    for item in rows:
+        yield json.dumps(item, ensure_ascii=False) + '\n'
+
+
+class Echo:
+    # Файл для csv.writer, который возвращает строку вместо записи
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for item in rows:
+        yield writer.writerow([item[column] for column in EXPORT_COLUMNS])
+
+
+def encode_blocks(lines, block_size=BLOCK_SIZE):
+    block = []
+    size = 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= block_size:
+            yield ''.join(block).encode()
+            block = []
+            size = 0
+    if block:
+        yield ''.join(block).encode()
+
+
+def gzip_blocks(blocks):
+    # Сжатие на лету: zlib сам накапливает данные и отдает сжатые
+    # блоки по мере заполнения своего буфера
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_bbs(queryset, format='ndjson', gzip=False, chunk_size=CHUNK_SIZE):
+    # Возвращает генератор блоков байтов
+    rows = export_rows(queryset, chunk_size)
+    lines = csv_lines(rows) if format == 'csv' else ndjson_lines(rows)
+    blocks = encode_blocks(lines)
+    return gzip_blocks(blocks) if gzip else blocks
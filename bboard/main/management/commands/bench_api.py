@@ -0,0 +1,231 @@
+import asyncio
+import io
+import multiprocessing
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import clear_url_caches
+
+from main.models import Bb
+from .bench_bboard import percentile
+
+# Запросы, которыми bbclient опрашивает API: список, объявление
+# и его комментарии; ETag ответа запоминается и отправляется в
+# следующем запросе того же клиента, как это делает браузер
+POLL_URLS = ('/api/bbs/', '/api/bbs/{pk}/', '/api/bbs/{pk}/comments/')
+
+# Сколько циклов опроса клиент остается на одном объявлении
+POLLS_PER_BB = 10
+
+
+def get_host():
+    if settings.ALLOWED_HOSTS and settings.ALLOWED_HOSTS[0] != '*':
+        return settings.ALLOWED_HOSTS[0]
+    return 'testserver'
+
+
+def use_views(asynchronous):
+    # Набор представлений API выбирается при импорте api.urls, поэтому
+    # после смены настройки модули маршрутов загружаются заново
+    settings.API_ASYNC_VIEWS = asynchronous
+    for name in ('api.urls', settings.ROOT_URLCONF):
+        sys.modules.pop(name, None)
+    clear_url_caches()
+    if asynchronous:
+        # То же, что задает bboard/asgi.py (см. DATABASES в settings.py)
+        for alias in connections:
+            connections[alias].settings_dict['CONN_MAX_AGE'] = 0
+    connections.close_all()
+
+
+class Client:
+    def __init__(self, sample, rnd, etags):
+        self.sample = sample
+        self.rnd = rnd
+        self.etags = {} if etags else None
+        self.step = 0
+
+    def next_request(self):
+        # Возвращает адрес и ETag для If-None-Match
+        if self.step % (len(POLL_URLS) * POLLS_PER_BB) == 0:
+            self.pk = self.rnd.choice(self.sample)
+        url = POLL_URLS[self.step % len(POLL_URLS)].format(pk=self.pk)
+        self.step += 1
+        return url, self.etags.get(url) if self.etags is not None else None
+
+    def remember(self, url, etag):
+        if self.etags is not None and etag:
+            self.etags[url] = etag
+
+
+def run_wsgi(sample, clients, duration, etags, seed):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    host = get_host()
+    results = []
+
+    def client(n):
+        state = Client(sample, random.Random(seed + n), etags)
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            url, etag = state.next_request()
+            environ = {
+                'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '',
+                'PATH_INFO': url, 'QUERY_STRING': '',
+                'SERVER_NAME': host, 'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': host,
+                'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+                'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0),
+                'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            if etag:
+                environ['HTTP_IF_NONE_MATCH'] = etag
+            response = {}
+
+            def start_response(status, headers, exc_info=None):
+                response['status'] = int(status.split()[0])
+                response['headers'] = dict(headers)
+
+            start = time.perf_counter()
+            body = handler(environ, start_response)
+            try:
+                b''.join(body)
+            finally:
+                body.close()
+            results.append(((time.perf_counter() - start) * 1000,
+                            response['status']))
+            state.remember(url, response['headers'].get('ETag'))
+        connections.close_all()
+
+    threads = [threading.Thread(target=client, args=(n,))
+               for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_asgi(sample, clients, duration, etags, seed):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+    host = get_host().encode()
+    results = []
+
+    async def request(url, etag):
+        headers = [(b'host', host)]
+        if etag:
+            headers.append((b'if-none-match', etag.encode()))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': url, 'raw_path': url.encode(), 'query_string': b'',
+            'root_path': '', 'headers': headers,
+            'client': ('127.0.0.1', 0), 'server': (host.decode(), 80),
+        }
+        messages = [{'type': 'http.request', 'body': b'',
+                     'more_body': False}]
+        disconnected = asyncio.Event()
+        response = {}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {name.decode().lower(): value.decode()
+                                       for name, value in message['headers']}
+
+        await application(scope, receive, send)
+        disconnected.set()
+        return response['status'], response['headers'].get('etag')
+
+    async def client(n):
+        state = Client(sample, random.Random(seed + n), etags)
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            url, etag = state.next_request()
+            start = time.perf_counter()
+            status, etag = await request(url, etag)
+            results.append(((time.perf_counter() - start) * 1000, status))
+            state.remember(url, etag)
+
+    async def main():
+        await asyncio.gather(*(client(n) for n in range(clients)))
+
+    asyncio.run(main())
+    return results
+
+
+def worker(mode, sample, clients, duration, etags, seed):
+    use_views(mode == 'asgi')
+    run = run_asgi if mode == 'asgi' else run_wsgi
+    start = time.perf_counter()
+    results = run(sample, clients, duration, etags, seed)
+    return results, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает синхронные представления API под WSGI и ' \
+           'асинхронные под ASGI при опросе API множеством клиентов ' \
+           '(как это делает bbclient)'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('wsgi', 'asgi', 'both'),
+                            default='both',
+                            help='wsgi -- синхронные представления в '
+                                 'потоках, asgi -- асинхронные '
+                                 'в цикле событий')
+        parser.add_argument('--clients', type=int, default=100,
+                            help='Одновременно опрашивающих клиентов')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Длительность каждого прогона, с')
+        parser.add_argument('--no-etag', action='store_true',
+                            help='Не отправлять If-None-Match (каждый '
+                                 'ответ -- полный)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        sample = list(Bb.objects.filter(is_active=True)
+                      .values_list('pk', flat=True)[:100])
+        if not sample:
+            raise CommandError('В базе нет объявлений; запустите seed_bboard')
+        modes = ('wsgi', 'asgi') if options['mode'] == 'both' \
+            else (options['mode'],)
+        connections.close_all()
+        # Каждый режим -- в отдельном процессе: маршруты и соединения
+        # с базой у них свои
+        context = multiprocessing.get_context('fork')
+        for mode in modes:
+            with context.Pool(1) as pool:
+                results, elapsed = pool.apply(
+                    worker, (mode, sample, options['clients'],
+                             options['duration'], not options['no_etag'],
+                             options['seed']))
+            self.report(mode, results, elapsed, options['clients'])
+
+    def report(self, mode, results, elapsed, clients):
+        latencies = [latency for latency, status in results]
+        statuses = {}
+        for latency, status in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        self.stdout.write(
+            f'{mode:4} клиентов {clients:4}  '
+            f'{len(results) / elapsed:8.1f} запр/с  '
+            f'p50 {percentile(latencies, 50) or 0:7.2f}  '
+            f'p95 {percentile(latencies, 95) or 0:7.2f}  '
+            f'p99 {percentile(latencies, 99) or 0:7.2f} мс  {statuses}')
@@ -0,0 +1,337 @@
+import base64
+import http.cookiejar
+import json
+import platform
+import statistics
+import time
+import types
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, include, path
+from rest_framework.authentication import BasicAuthentication
+
+from api.views import export
+from main.models import AdvUser, Bb, Comment
+
+AUTH_URL = '/api/bbs/export/?since=2100-01-01'
+# Та же выгрузка, но с проверкой логина и пароля в каждом запросе, как
+# в API до перехода на ключи (см. bench_urlconf)
+BASIC_AUTH_PATH = 'bench/basic/export/'
+BASIC_AUTH_URL = f'/{BASIC_AUTH_PATH}?since=2100-01-01'
+
+# Сценарии: имя -> (функция построения адреса, способ входа). Способ
+# входа: False -- без входа, True -- вход на сайт (сессия), 'basic' --
+# логин и пароль в каждом запросе, 'token' -- ключ из api/login/
+SCENARIOS = {
+    'index': (lambda d: '/', False),
+    'rubric_bbs': (lambda d: f'/{d["rubric"]}/', False),
+    'rubric_bbs_keyword':
+        (lambda d: f'/{d["rubric"]}/?keyword={d["keyword"]}', False),
+    'bb_detail_anonymous': (lambda d: f'/{d["rubric"]}/{d["bb"]}/', False),
+    'bb_detail_user': (lambda d: f'/{d["rubric"]}/{d["bb"]}/', True),
+    'api_bbs': (lambda d: '/api/bbs/', False),
+    'api_bb': (lambda d: f'/api/bbs/{d["bb"]}/', False),
+    'api_comments': (lambda d: f'/api/bbs/{d["bb"]}/comments/', False),
+    # Стоимость проверки пользователя в API: пустая выгрузка требует
+    # входа, а сама почти ничего не стоит
+    'api_auth_session': (lambda d: AUTH_URL, True),
+    'api_auth_basic': (lambda d: BASIC_AUTH_URL, 'basic'),
+    'api_auth_token': (lambda d: AUTH_URL, 'token'),
+}
+
+
+def percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else None
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+def basic_authorization(username, password):
+    credentials = f'{username}:{password}'.encode()
+    return 'Basic ' + base64.b64encode(credentials).decode()
+
+
+def bench_urlconf(urlconf):
+    # Маршруты сайта и выгрузка с BasicAuthentication: в настройках API
+    # ее больше нет, а без нее сценарий api_auth_basic измерял бы
+    # быстрый ответ 401 вместо проверки пароля
+    module = types.ModuleType('bench_urls')
+    module.urlpatterns = [
+        path(BASIC_AUTH_PATH, export.cls.as_view(
+            authentication_classes=(BasicAuthentication,))),
+        path('', include(urlconf)),
+    ]
+    return module
+
+
+class InProcessRunner:
+    # Запросы выполняются тестовым клиентом Django в этом же процессе
+    def __init__(self, username, password):
+        self.host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS \
+            and settings.ALLOWED_HOSTS[0] != '*' else 'testserver'
+        self.username = username
+        self.password = password
+        self.clients = {False: Client(HTTP_HOST=self.host)}
+
+    def get_client(self, user):
+        # Клиенты с входом создаются при первом обращении
+        if user in self.clients:
+            return self.clients[user]
+        if user == 'basic':
+            settings.ROOT_URLCONF = bench_urlconf(settings.ROOT_URLCONF)
+            clear_url_caches()
+            client = Client(HTTP_HOST=self.host,
+                            HTTP_AUTHORIZATION=basic_authorization(
+                                self.username, self.password))
+        elif user == 'token':
+            response = Client(HTTP_HOST=self.host).post(
+                '/api/login/', {'username': self.username,
+                                'password': self.password})
+            if response.status_code != 200:
+                raise CommandError(f'Не удалось получить ключ для '
+                                   f'{self.username}')
+            client = Client(HTTP_HOST=self.host, HTTP_AUTHORIZATION=(
+                'Token ' + response.json()['token']))
+        else:
+            client = Client(HTTP_HOST=self.host)
+            if not client.login(username=self.username,
+                                password=self.password):
+                raise CommandError(f'Не удалось войти как {self.username}')
+        self.clients[user] = client
+        return client
+
+    def request(self, url, user):
+        response = self.get_client(user).get(url)
+        return response.status_code
+
+    def count_queries(self, url, user):
+        with ExitStack() as stack:
+            queries = [stack.enter_context(CaptureQueriesContext(connection))
+                       for connection in connections.all()]
+            self.request(url, user)
+        return sum(len(captured) for captured in queries)
+
+
+class HttpRunner:
+    # Запросы к запущенному серверу (gunicorn, uvicorn и т. п.)
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.openers = {False: urllib.request.build_opener()}
+
+    def get_opener(self, user):
+        if user in self.openers:
+            return self.openers[user]
+        if user == 'basic':
+            raise CommandError('Сервер не принимает логин и пароль в '
+                               'запросах API: сценарий api_auth_basic '
+                               'выполняется только без --url')
+        if user == 'token':
+            opener = urllib.request.build_opener()
+            opener.addheaders.append(
+                ('Authorization', 'Token ' + self.get_token()))
+        else:
+            opener = self.login(self.username, self.password)
+        self.openers[user] = opener
+        return opener
+
+    def get_token(self):
+        data = urllib.parse.urlencode({'username': self.username,
+                                       'password': self.password}).encode()
+        try:
+            with urllib.request.urlopen(self.base_url + '/api/login/',
+                                        data) as response:
+                return json.load(response)['token']
+        except urllib.error.HTTPError:
+            raise CommandError(f'Не удалось получить ключ для '
+                               f'{self.username}')
+
+    def login(self, username, password):
+        jar = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(jar))
+        login_url = self.base_url + '/accounts/login/'
+        opener.open(login_url).read()
+        token = next((c.value for c in jar if c.name == 'csrftoken'), '')
+        data = urllib.parse.urlencode({
+            'username': username, 'password': password,
+            'csrfmiddlewaretoken': token}).encode()
+        opener.open(urllib.request.Request(
+            login_url, data, headers={'Referer': login_url})).read()
+        if not any(c.name == 'sessionid' for c in jar):
+            raise CommandError(f'Не удалось войти как {username}')
+        return opener
+
+    def request(self, url, user):
+        try:
+            with self.get_opener(user).open(self.base_url + url) \
+                    as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def count_queries(self, url, user):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Измеряет производительность основных страниц и API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help='Сценарии (по умолчанию все): ' +
+                                 ', '.join(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--url',
+                            help='Адрес запущенного сервера; без него '
+                                 'запросы выполняются в этом процессе')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Параллельных потоков (только с --url)')
+        parser.add_argument('--username',
+                            help='Пользователь для сценариев с входом '
+                                 '(по умолчанию — первый из seed_bboard)')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--keyword', default='продам')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='JSON прошлого запуска')
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help='Допустимое ухудшение p95 (доля)')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError('Неизвестные сценарии: ' + ', '.join(unknown))
+        data = self.get_data(options)
+        username = None
+        if any(SCENARIOS[name][1] for name in names):
+            username = options['username'] or data['username']
+        if options['url']:
+            runner = HttpRunner(options['url'], username, options['password'])
+        else:
+            if options['concurrency'] > 1:
+                raise CommandError('--concurrency используется только с --url')
+            runner = InProcessRunner(username, options['password'])
+        results = {}
+        for name in names:
+            build_url, user = SCENARIOS[name]
+            results[name] = self.run(runner, build_url(data), user, options)
+            self.report(name, results[name])
+        report = {
+            'meta': {'date': datetime.now().isoformat(),
+                     'python': platform.python_version(),
+                     'url': options['url'] or 'in-process',
+                     'concurrency': options['concurrency'],
+                     'requests': options['requests'],
+                     'database': str(settings.DATABASES['default']['NAME']),
+                     'bbs': Bb.objects.count()},
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results, options['threshold'])
+
+    def get_data(self, options):
+        bbs = Bb.objects.filter(is_active=True)
+        hot_rubric = bbs.values('rubric').annotate(count=Count('pk')) \
+                        .order_by('-count').first()
+        hot_bb = Comment.objects.filter(is_active=True, bb__is_active=True) \
+                        .values('bb').annotate(count=Count('pk')) \
+                        .order_by('-count').first()
+        if hot_bb:
+            bb = bbs.get(pk=hot_bb['bb'])
+        else:
+            bb = bbs.first()
+        if not hot_rubric or not bb:
+            raise CommandError('В базе нет объявлений; запустите seed_bboard')
+        user = AdvUser.objects.filter(username__startswith='seed',
+                                      is_active=True).order_by('pk').first()
+        return {'rubric': hot_rubric['rubric'], 'bb': bb.pk,
+                'keyword': urllib.parse.quote(options['keyword']),
+                'username': user.username if user else None}
+
+    def run(self, runner, url, user, options):
+        # Ответ с ошибкой (например, 401 вместо проверки пароля) означал
+        # бы, что измеряется не то
+        status = runner.request(url, user)
+        if status >= 400:
+            raise CommandError(f'{url}: ответ {status}')
+        for _ in range(options['warmup']):
+            runner.request(url, user)
+        queries = runner.count_queries(url, user)
+
+        def timed(_):
+            start = time.perf_counter()
+            status = runner.request(url, user)
+            return time.perf_counter() - start, status
+
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            samples = list(pool.map(timed, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+        # Процессорное время сервера известно, только если запросы
+        # выполняются в этом же процессе
+        cpu = None if options['url'] else \
+            (time.process_time() - cpu_start) * 1000 / len(samples)
+        latencies = [latency * 1000 for latency, status in samples]
+        statuses = {}
+        for latency, status in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            'url': url,
+            'throughput': len(samples) / elapsed,
+            'mean_ms': statistics.fmean(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'cpu_ms': cpu,
+            'queries': queries,
+            'statuses': statuses,
+        }
+
+    def report(self, name, result):
+        cpu = f'CPU {result["cpu_ms"]:7.2f} мс  ' \
+            if result['cpu_ms'] is not None else ''
+        self.stdout.write(
+            f'{name:22} {result["throughput"]:8.1f} запр/с  '
+            f'p50 {result["p50_ms"]:7.2f}  p95 {result["p95_ms"]:7.2f}  '
+            f'p99 {result["p99_ms"]:7.2f} мс  {cpu}'
+            f'SQL {result["queries"] if result["queries"] is not None else "-"}'
+            f'  {result["statuses"]}')
+
+    def compare(self, path, results, threshold):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['scenarios']
+        regressions = []
+        for name, result in results.items():
+            old = baseline.get(name)
+            if not old:
+                continue
+            if result['p95_ms'] > old['p95_ms'] * (1 + threshold):
+                regressions.append(f'{name}: p95 {old["p95_ms"]:.2f} -> '
+                                   f'{result["p95_ms"]:.2f} мс')
+            if None not in (result['queries'], old['queries']) and \
+                    result['queries'] > old['queries']:
+                regressions.append(f'{name}: SQL-запросов '
+                                   f'{old["queries"]} -> {result["queries"]}')
+        if regressions:
+            raise CommandError('Обнаружено ухудшение:\n' +
+                               '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Ухудшений не обнаружено'))
@@ -0,0 +1,160 @@
+import multiprocessing
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction, OperationalError
+
+from bboard.routers import replica_reads
+from main.models import AdvUser, Bb, Comment, Rating
+from .bench_bboard import percentile
+
+BENCH_USERNAME = 'bench_sqlite'
+
+# Параметры SQLite по умолчанию -- для сравнения с настроенными
+PLAIN_OPTIONS = {
+    'pragmas': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'temp_store': 'DEFAULT',
+    },
+    'transaction_mode': 'DEFERRED',
+}
+
+
+def use_plain_settings():
+    # Все запросы идут через одно соединение с параметрами по умолчанию;
+    # возвращаются прежние настройки для restore_settings()
+    saved = {alias: connections[alias].settings_dict['OPTIONS']
+             for alias in connections}
+    saved[None] = settings.DATABASE_REPLICAS
+    for alias in connections:
+        settings_dict = connections[alias].settings_dict
+        settings_dict['OPTIONS'] = {**settings_dict['OPTIONS'],
+                                    **PLAIN_OPTIONS}
+    settings.DATABASE_REPLICAS = []
+    return saved
+
+
+def restore_settings(saved):
+    connections.close_all()
+    settings.DATABASE_REPLICAS = saved.pop(None)
+    for alias, options in saved.items():
+        connections[alias].settings_dict['OPTIONS'] = options
+
+
+def read(pk, rubric, rnd):
+    list(Bb.objects.filter(is_active=True, rubric=rubric)
+         .select_related('rubric')[:10])
+    list(Comment.objects.filter(bb=pk, is_active=True))
+
+
+def write(pk, rubric, rnd, user_pk):
+    with transaction.atomic():
+        Rating.objects.update_or_create(
+            bb_id=pk, user_id=user_pk,
+            defaults={'score': rnd.randint(1, 5)})
+
+
+def worker(role, start_at, duration, sample, user_pk, plain, seed):
+    if plain:
+        use_plain_settings()
+    rnd = random.Random(seed)
+    latencies = []
+    errors = 0
+    time.sleep(max(start_at - time.time(), 0))
+    deadline = start_at + duration
+    while time.time() < deadline:
+        pk, rubric = rnd.choice(sample)
+        start = time.perf_counter()
+        try:
+            # Чтение -- как в запросе сайта, через реплики
+            with replica_reads():
+                if role == 'write':
+                    write(pk, rubric, rnd, user_pk)
+                else:
+                    read(pk, rubric, rnd)
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    connections.close_all()
+    return role, latencies, errors
+
+
+class Command(BaseCommand):
+    help = 'Измеряет одновременное чтение и запись в SQLite из ' \
+           'нескольких процессов: с настроенными параметрами ' \
+           'соединения и с параметрами по умолчанию'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Читающих процессов')
+        parser.add_argument('--writers', type=int, default=2,
+                            help='Пишущих процессов')
+        parser.add_argument('--duration', type=float, default=5,
+                            help='Длительность каждого прогона, с')
+        parser.add_argument('--mode', choices=('tuned', 'plain', 'both'),
+                            default='both',
+                            help='tuned -- параметры из DATABASES, '
+                                 'plain -- параметры SQLite по умолчанию')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Команда рассчитана на SQLite')
+        sample = list(Bb.objects.filter(is_active=True)
+                      .values_list('pk', 'rubric')[:1000])
+        if not sample:
+            raise CommandError('В базе нет объявлений; запустите seed_bboard')
+        user, created = AdvUser.objects.get_or_create(
+            username=BENCH_USERNAME, defaults={'is_active': False})
+        modes = ('tuned', 'plain') if options['mode'] == 'both' \
+            else (options['mode'],)
+        try:
+            for mode in modes:
+                self.run(mode, sample, user.pk, options)
+        finally:
+            # Оценки удаляются по одной, чтобы сигналы вернули счетчики
+            for rating in Rating.objects.filter(user=user):
+                rating.delete()
+            user.delete()
+
+    def run(self, mode, sample, user_pk, options):
+        plain = mode == 'plain'
+        if plain:
+            # Режим журнала меняется монопольно, до запуска процессов
+            saved = use_plain_settings()
+            connections['default'].ensure_connection()
+        connections.close_all()
+        start_at = time.time() + 1
+        tasks = [('read', start_at, options['duration'], sample, user_pk,
+                  plain, options['seed'] + n)
+                 for n in range(options['readers'])]
+        tasks += [('write', start_at, options['duration'], sample, user_pk,
+                   plain, options['seed'] + 1000 + n)
+                  for n in range(options['writers'])]
+        context = multiprocessing.get_context('fork')
+        with context.Pool(len(tasks)) as pool:
+            results = pool.starmap(worker, tasks)
+        if plain:
+            restore_settings(saved)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{mode}: читателей {options["readers"]}, '
+            f'писателей {options["writers"]}'))
+        for role in ('read', 'write'):
+            latencies = [value for r, values, e in results if r == role
+                         for value in values]
+            errors = sum(e for r, values, e in results if r == role)
+            if not latencies and not errors:
+                continue
+            self.stdout.write(
+                f'  {role:6} {len(latencies) / options["duration"]:9.1f} '
+                f'опер/с  '
+                f'p50 {percentile(latencies, 50) or 0:7.2f}  '
+                f'p95 {percentile(latencies, 95) or 0:7.2f}  '
+                f'p99 {percentile(latencies, 99) or 0:7.2f} мс  '
+                f'ошибок блокировки {errors}')
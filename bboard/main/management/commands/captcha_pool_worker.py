@@ -0,0 +1,59 @@
+import secrets
+import time
+from datetime import timedelta
+
+from captcha.conf import settings as captcha_settings
+from captcha.models import CaptchaStore
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+def get_pool_size():
+    # Задания, которые еще можно выдавать (см. CaptchaStore.pick)
+    minimum_expiration = timezone.now() + timedelta(
+        minutes=int(captcha_settings.CAPTCHA_GET_FROM_POOL_TIMEOUT))
+    return CaptchaStore.objects \
+        .filter(expiration__gt=minimum_expiration).count()
+
+
+def new_challenge(expiration):
+    # То же, что делает CaptchaStore.save(), но для bulk_create
+    challenge, response = captcha_settings.get_challenge()()
+    return CaptchaStore(challenge=challenge, response=response.lower(),
+                        hashkey=secrets.token_hex(20), expiration=expiration)
+
+
+class Command(BaseCommand):
+    help = 'Поддерживает пул готовых заданий CAPTCHA ' \
+           '(CAPTCHA_GET_FROM_POOL): удаляет просроченные и добавляет ' \
+           'недостающие'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=500,
+                            help='Сколько заданий держать в пуле')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять с этой паузой, с; без него -- '
+                                 'один раз')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        while True:
+            self.refill(options['size'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def refill(self, size):
+        # Просроченные удаляются одним запросом, новые добавляются
+        # одним bulk_create
+        deleted, _ = CaptchaStore.objects \
+            .filter(expiration__lte=timezone.now()).delete()
+        missing = size - get_pool_size()
+        if missing > 0:
+            expiration = timezone.now() + timedelta(
+                minutes=int(captcha_settings.CAPTCHA_TIMEOUT))
+            CaptchaStore.objects.bulk_create(
+                [new_challenge(expiration) for _ in range(missing)])
+        if self.verbosity > 1 or deleted or missing > 0:
+            self.stdout.write(f'CAPTCHA: удалено {deleted}, '
+                              f'добавлено {max(missing, 0)}')
@@ -0,0 +1,154 @@
+from django.core.management.base import BaseCommand, CommandError
+from contextlib import ExitStack
+
+from django.db import connections
+from django.db.models import Count
+from django.http import HttpRequest
+
+from main.conditional import get_bbs_state
+from main.models import AdvUser, SubRubric, Bb, Comment, Rating
+from main.pagination import CursorPaginator
+from main.search import search_bbs
+
+# Признаки плохого плана в выводе EXPLAIN QUERY PLAN: полный просмотр
+# таблицы (SCAN без USING INDEX) и сортировка во временном B-дереве
+SCAN = 'полный просмотр'
+TEMP_SORT = 'сортировка во временном B-дереве'
+
+# Допустимые отклонения: найденные полнотекстовым поиском записи
+# сортируются уже после отбора по MATCH, индекс тут не поможет
+EXPECTED = {
+    'rubric_bbs_search': {TEMP_SORT},
+}
+
+
+def walk(queryset, per_page):
+    # Первая страница и переход по курсору на вторую -- как в списках
+    paginator = CursorPaginator(queryset, per_page)
+    page = paginator.get_page()
+    paginator.count
+    if page.has_next():
+        page = paginator.get_page(page.next_cursor)
+        paginator.get_page(page.previous_cursor)
+
+
+def get_hot_queries(rubric, author, bb, user):
+    bbs = Bb.objects.all()
+    return (
+        ('index', lambda: list(bbs.filter(is_active=True)
+                               .select_related('rubric')[:10])),
+        ('index_etag', lambda: get_bbs_state(HttpRequest())),
+        ('rubric_bbs', lambda: walk(bbs.filter(is_active=True,
+                                               rubric=rubric.pk), 2)),
+        ('rubric_bbs_etag', lambda: get_bbs_state(HttpRequest(),
+                                                  rubric.pk)),
+        ('rubric_bbs_search', lambda: list(search_bbs(
+            bbs.filter(is_active=True, rubric=rubric.pk), 'велосипед')[:3])),
+        ('profile', lambda: walk(bbs.filter(author=author.pk), 10)),
+        ('bb_detail', lambda: bbs.with_user_score(user).get(pk=bb.pk)),
+        ('bb_comments', lambda: list(Comment.objects
+                                     .filter(bb=bb.pk, is_active=True))),
+        ('bb_comments_since', lambda: list(Comment.objects
+                                           .filter(bb=bb.pk, is_active=True,
+                                                   pk__gt=0)
+                                           .order_by('pk')[:100])),
+        ('user_ratings', lambda: list(Rating.objects
+                                      .filter(user=user.pk)
+                                      .values_list('bb_id', flat=True))),
+        ('api_bbs', lambda: walk(bbs.filter(is_active=True), 10)),
+    )
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # Служебные запросы интроспекции (см. fts_available) не нужны
+        if not many and sql.lstrip().upper().startswith('SELECT') \
+           and 'sqlite_master' not in sql:
+            self.queries.append((context['connection'], sql, params))
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Выводит планы выполнения (EXPLAIN QUERY PLAN) частых ' \
+           'запросов и отмечает полные просмотры таблиц и сортировки ' \
+           'во временном B-дереве'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', default=[],
+                            help='Проверить только указанный запрос '
+                                 '(можно задать несколько раз)')
+        parser.add_argument('--fail', action='store_true',
+                            help='Завершиться с ошибкой, если найдены '
+                                 'проблемные планы (для CI)')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN поддерживается только '
+                               'в SQLite')
+        self.verbosity = options['verbosity']
+        sample = self.get_sample()
+        problems = 0
+        for name, run in get_hot_queries(*sample):
+            if options['only'] and name not in options['only']:
+                continue
+            recorder = QueryRecorder()
+            # Чтение может идти и через другие соединения (см. роутер)
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                run()
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for connection, sql, params in recorder.queries:
+                problems += self.explain(connection, sql, params,
+                                         EXPECTED.get(name, set()))
+        if problems:
+            message = f'Проблемных запросов: {problems}'
+            if options['fail']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Все частые запросы используют индексы'))
+
+    def get_sample(self):
+        # Для проверки берутся самые «тяжелые» рубрика, автор,
+        # объявление и пользователь
+        rubric = SubRubric.objects \
+            .annotate(n=Count('bb')).order_by('-n').first()
+        author = AdvUser.objects \
+            .annotate(n=Count('bb')).order_by('-n').first()
+        bb = Bb.objects \
+            .annotate(n=Count('comment')).order_by('-n').first()
+        user = AdvUser.objects \
+            .annotate(n=Count('rating')).order_by('-n').first()
+        if not (rubric and author and bb and user):
+            raise CommandError('В базе нет объявлений; заполните ее '
+                               'командой seed_bboard')
+        return rubric, author, bb, user
+
+    def explain(self, connection, sql, params, expected):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params or ())
+            plan = cursor.fetchall()
+        flags = set()
+        for *_, detail in plan:
+            if detail.startswith('SCAN ') and 'USING' not in detail \
+               and 'VIRTUAL TABLE' not in detail \
+               and 'CONSTANT ROW' not in detail:
+                flags.add(SCAN)
+            if 'TEMP B-TREE' in detail:
+                flags.add(TEMP_SORT)
+        flags -= expected
+        if flags or self.verbosity > 1:
+            self.stdout.write('  ' + sql)
+            if params:
+                self.stdout.write(f'  -- {list(params)}')
+            for *_, detail in plan:
+                self.stdout.write('    ' + detail)
+        if flags:
+            self.stdout.write(self.style.ERROR(
+                '    ! ' + ', '.join(sorted(flags))))
+        return bool(flags)
@@ -0,0 +1,63 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.export import FORMATS, CHUNK_SIZE, get_export_queryset, \
+     export_bbs, parse_moment
+
+
+class Command(BaseCommand):
+    help = 'Выгружает активные объявления в NDJSON или CSV ' \
+           '(то же, что /api/bbs/export/)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=tuple(FORMATS),
+                            default='ndjson')
+        parser.add_argument('--rubric', type=int,
+                            help='Только объявления этой рубрики')
+        parser.add_argument('--since',
+                            help='Опубликованные начиная с этого момента '
+                                 '(дата или дата и время в ISO 8601)')
+        parser.add_argument('--until',
+                            help='Опубликованные до этого момента; дата '
+                                 'включается целиком')
+        parser.add_argument('--gzip', action='store_true',
+                            help='Сжимать вывод gzip')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Записей, читаемых из базы за раз')
+        parser.add_argument('--output', '-o',
+                            help='Файл для выгрузки; без него -- '
+                                 'стандартный вывод')
+
+    def handle(self, *args, **options):
+        moments = {}
+        for name in ('since', 'until'):
+            if options[name]:
+                moments[name] = parse_moment(options[name],
+                                             end=name == 'until')
+                if moments[name] is None:
+                    raise CommandError(f'Неверное значение --{name}: '
+                                       f'{options[name]}')
+        queryset = get_export_queryset(options['rubric'], **moments)
+        blocks = export_bbs(queryset, options['format'], options['gzip'],
+                            options['chunk_size'])
+        start = time.perf_counter()
+        size = 0
+        if options['output']:
+            file = open(options['output'], 'wb')
+        else:
+            file = sys.stdout.buffer
+        try:
+            for block in blocks:
+                file.write(block)
+                size += len(block)
+        finally:
+            if options['output']:
+                file.close()
+            else:
+                file.flush()
+        # Сводка -- в stderr, чтобы не смешиваться с выгрузкой
+        self.stderr.write(f'Выгружено {size / 1024:.0f} КБ за '
+                          f'{time.perf_counter() - start:.1f} с',
+                          style_func=self.style.SUCCESS)
@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main.models import Bb, AdditionalImage
+from main.thumbnails import generate_thumbnails
+
+
+def generate(label, name):
+    model = apps.get_model(label)
+    field = model._meta.get_field('image')
+    generate_thumbnails(field.attr_class(model(), field, name))
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры для уже загруженных изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Количество рабочих процессов')
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in (Bb, AdditionalImage):
+            names = model.objects.exclude(image='') \
+                                 .values_list('image', flat=True)
+            jobs += [(model._meta.label, name) for name in names.iterator()]
+        # Дочерние процессы открывают собственные соединения с базой
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            labels, names = zip(*jobs) if jobs else ((), ())
+            for done, _ in enumerate(pool.map(generate, labels, names,
+                                              chunksize=16), 1):
+                if done % 100 == 0:
+                    self.stdout.write(f'Обработано изображений: {done}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры созданы для {len(jobs)} изображений'))
@@ -0,0 +1,272 @@
+import csv
+import gzip
+import io
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path, PurePosixPath
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from main.models import AdvUser, SubRubric, Bb
+from main.pagecache import invalidate_bb_pages
+from .seed_bboard import explicit_dates
+
+# Поля, которые проверяются по ограничениям модели (max_length,
+# blank, тип значения) без создания формы на каждую строку
+CLEANED_FIELDS = ('title', 'content', 'price', 'contacts')
+
+
+def read_records(path, format):
+    # Записи файла по одной, без чтения его целиком; .gz распаковывается
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as file:
+        if format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Запись отклоняется, но номера следующих
+                        # записей не сдвигаются
+                        yield None
+
+
+def load_image(source, media_root, timeout):
+    # Возвращает имя сохраненного файла; source -- адрес http(s) или путь
+    # (относительно media_root; адрес из export_bbs тоже подходит)
+    from PIL import Image
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            data = response.read()
+        filename = PurePosixPath(urllib.parse.urlsplit(source).path).name
+    else:
+        if source.startswith(settings.MEDIA_URL):
+            source = source[len(settings.MEDIA_URL):]
+        data = (Path(media_root) / source).read_bytes()
+        filename = Path(source).name
+    Image.open(io.BytesIO(data)).verify()
+    field = Bb._meta.get_field('image')
+    return default_storage.save(field.generate_filename(None, filename),
+                                ContentFile(data))
+
+
+def delete_images(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+class Command(BaseCommand):
+    help = 'Импортирует объявления из CSV или JSONL (например, выгрузки ' \
+           'export_bbs) пакетами; прерванный импорт продолжается с ' \
+           'последнего сохраненного пакета'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV или JSONL (можно .gz)')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Формат файла; по умолчанию -- '
+                                 'по расширению')
+        parser.add_argument('--author',
+                            help='Автор объявлений, у которых в файле '
+                                 'не указан author')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--image-workers', type=int, default=8,
+                            help='Потоков загрузки изображений')
+        parser.add_argument('--image-timeout', type=float, default=30)
+        parser.add_argument('--media-root',
+                            help='Каталог, относительно которого заданы '
+                                 'пути изображений; по умолчанию -- '
+                                 'каталог файла')
+        parser.add_argument('--state',
+                            help='Файл состояния импорта; по умолчанию -- '
+                                 '<файл>.state')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать сначала, не учитывая состояние')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        format = options['format'] or (
+            'csv' if path.removesuffix('.gz').endswith('.csv') else 'jsonl')
+        self.options = options
+        self.media_root = options['media_root'] or \
+            os.path.dirname(os.path.abspath(path))
+        self.state_path = options['state'] or path + '.state'
+        self.rubric_pks = {}
+        self.rubric_names = {}
+        for pk, name in SubRubric.objects.values_list('pk', 'name'):
+            self.rubric_pks[str(pk)] = self.rubric_names[name] = pk
+        self.authors = {}
+        self.default_author = None
+        if options['author']:
+            self.default_author = self.get_authors([options['author']]) \
+                                      .get(options['author'])
+            if self.default_author is None:
+                raise CommandError(f'Пользователь {options["author"]} '
+                                   f'не найден')
+        self.fields = {name: Bb._meta.get_field(name)
+                       for name in CLEANED_FIELDS}
+
+        done = 0
+        if not options['restart'] and os.path.exists(self.state_path):
+            with open(self.state_path, encoding='utf-8') as file:
+                done = json.load(file)['records']
+            self.stdout.write(f'Продолжение после записи {done}')
+        records = enumerate(read_records(path, format), 1)
+        # Уже импортированные записи только прочитываются
+        for _ in islice(records, done):
+            pass
+
+        imported = errors = images_failed = 0
+        start = time.perf_counter()
+        dates = (Bb._meta.get_field('created_at'),
+                 Bb._meta.get_field('updated_at'))
+        with ThreadPoolExecutor(max_workers=options['image_workers']) \
+                as self.executor, explicit_dates(*dates):
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                bbs, batch_errors, batch_images_failed = \
+                    self.build_batch(batch)
+                try:
+                    with transaction.atomic():
+                        Bb.objects.bulk_create(bbs)
+                except BaseException:
+                    # Пакет будет импортирован заново, вместе с
+                    # изображениями, поэтому уже сохраненные удаляются
+                    delete_images(bb.image.name for bb in bbs if bb.image)
+                    raise
+                # bulk_create не отправляет post_save
+                invalidate_bb_pages({bb.rubric_id for bb in bbs})
+                # Состояние записывается сразу после фиксации пакета; при
+                # аварии ровно между ними пакет будет импортирован повторно
+                self.save_state(batch[-1][0])
+                imported += len(bbs)
+                errors += batch_errors
+                images_failed += batch_images_failed
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'Запись {batch[-1][0]}: импортировано '
+                                  f'{imported}, отклонено {errors}, '
+                                  f'{imported / elapsed:.0f} строк/с')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано объявлений: {imported} за {elapsed:.1f} с '
+            f'({imported / elapsed if elapsed else 0:.0f} строк/с); '
+            f'отклонено строк: {errors}; '
+            f'не загружено изображений: {images_failed}'))
+        if imported:
+            self.stdout.write('Миниатюры: manage.py generate_thumbnails')
+
+    def get_authors(self, usernames):
+        missing = [name for name in usernames if name not in self.authors]
+        if missing:
+            self.authors.update(AdvUser.objects.filter(username__in=missing)
+                                .values_list('username', 'pk'))
+        return self.authors
+
+    def build_batch(self, batch):
+        authors = self.get_authors({record['author'] for n, record in batch
+                                    if isinstance(record, dict)
+                                    and record.get('author')})
+        now = timezone.now()
+        rows = []
+        errors = 0
+        for n, record in batch:
+            try:
+                if not isinstance(record, dict):
+                    raise ValidationError('неверная строка JSON')
+                rows.append((n, self.clean(record, authors, now),
+                             record.get('image') or ''))
+            except ValidationError as error:
+                errors += 1
+                self.stderr.write(f'Запись {n}: ' + '; '.join(error.messages))
+        # Изображения пакета загружаются параллельно; объявление с
+        # незагруженным изображением импортируется без него
+        futures = [self.executor.submit(load_image, image, self.media_root,
+                                        self.options['image_timeout'])
+                   if image else None for n, bb, image in rows]
+        images_failed = 0
+        try:
+            for (n, bb, image), future in zip(rows, futures):
+                if future is None:
+                    continue
+                try:
+                    bb.image = future.result()
+                except Exception as error:
+                    images_failed += 1
+                    self.stderr.write(f'Запись {n}: изображение {image} не '
+                                      f'загружено ({error})')
+        except BaseException:
+            # Импорт прерван: дожидаемся уже начатых загрузок и удаляем
+            # сохраненные файлы
+            futures = [future for future in futures
+                       if future and not future.cancel()]
+            wait(futures)
+            delete_images(future.result() for future in futures
+                          if future.exception() is None)
+            raise
+        return [bb for n, bb, image in rows], errors, images_failed
+
+    def clean(self, record, authors, now):
+        values = {}
+        errors = []
+        for name, field in self.fields.items():
+            value = record.get(name)
+            if value in (None, '') and field.has_default():
+                value = field.get_default()
+            try:
+                values[name] = field.clean(value, None)
+            except ValidationError as error:
+                errors += [f'{name}: {message}' for message in error.messages]
+        # Ключи рубрик в другой базе не совпадают с нашими, поэтому
+        # рубрика ищется по названию, а ключ (rubric) используется, только
+        # если названия в записи нет
+        name = str(record.get('rubric_name') or '')
+        rubric = str(record.get('rubric') or '')
+        if name:
+            rubric_pk = self.rubric_names.get(name)
+        elif rubric.isdigit():
+            rubric_pk = self.rubric_pks.get(rubric)
+        else:
+            rubric_pk = self.rubric_names.get(rubric)
+        if rubric_pk is None:
+            errors.append('rubric: рубрика {!r} не найдена'.format(
+                name or rubric))
+        author = record.get('author')
+        author_pk = authors.get(author) if author else self.default_author
+        if author_pk is None:
+            errors.append(f'author: пользователь {author!r} не найден'
+                          if author else 'author: автор не указан')
+        created_at = now
+        if record.get('created_at'):
+            created_at = parse_datetime(record['created_at'])
+            if created_at is None:
+                errors.append('created_at: неверная дата')
+            elif timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at)
+        if errors:
+            raise ValidationError(errors)
+        # updated_at -- момент импорта: ETag списков должен измениться
+        return Bb(rubric_id=rubric_pk, author_id=author_pk,
+                  created_at=created_at, updated_at=now, **values)
+
+    def save_state(self, records):
+        temp = self.state_path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as file:
+            json.dump({'records': records}, file)
+        os.replace(temp, self.state_path)
@@ -0,0 +1,32 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные сессии из базы по частям: каждая часть ' \
+           'выбирается по индексу expire_date и удаляется в отдельной ' \
+           'короткой транзакции'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сессий за один проход')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Пауза между проходами, с')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+        while True:
+            keys = list(Session.objects.filter(expire_date__lt=now)
+                        .values_list('pk', flat=True)
+                        [:options['batch_size']])
+            if not keys:
+                break
+            Session.objects.filter(pk__in=keys).delete()
+            total += len(keys)
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено сессий: {total}'))
@@ -0,0 +1,26 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from main.models import StaleFile
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из хранилища файлы удаленных объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Файлов за один проход')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            files = list(StaleFile.objects.order_by('pk')
+                         [:options['batch_size']])
+            if not files:
+                break
+            for file in files:
+                if default_storage.exists(file.name):
+                    default_storage.delete(file.name)
+            StaleFile.objects.filter(pk__in=[f.pk for f in files]).delete()
+            total += len(files)
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {total}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import Bb
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики оценок у объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pks', nargs='*', type=int,
+                            help='Ключи объявлений (по умолчанию — все)')
+
+    def handle(self, *args, **options):
+        bbs = Bb.objects.all()
+        if options['pks']:
+            bbs = bbs.filter(pk__in=options['pks'])
+        with transaction.atomic():
+            count = bbs.rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики оценок пересчитаны у {count} объявлений'))
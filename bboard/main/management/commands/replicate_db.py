@@ -0,0 +1,52 @@
+import sqlite3
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик из ' \
+           'DATABASE_REPLICAS (замена репликации для локальной проверки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять копирование с этой паузой, с; '
+                                 'без него -- один раз')
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Страниц за шаг копирования: между шагами '
+                                 'основная база доступна для записи')
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Команда рассчитана на SQLite')
+        replicas = [connections[alias].settings_dict['NAME']
+                    for alias in settings.DATABASE_REPLICAS
+                    if Path(connections[alias].settings_dict['NAME'])
+                    != Path(primary['NAME'])]
+        if not replicas:
+            raise CommandError('Все реплики в DATABASE_REPLICAS используют '
+                               'файл основной базы; копировать нечего')
+        while True:
+            for name in replicas:
+                self.copy(primary['NAME'], name, options['pages'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, source_name, target_name, pages):
+        # Копия пишется поверх файла реплики, а не заменяет его:
+        # открытые соединения с репликой сразу видят новые данные
+        start = time.perf_counter()
+        source = sqlite3.connect(f'file:{source_name}?mode=ro', uri=True)
+        target = sqlite3.connect(target_name)
+        try:
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(f'{target_name}: '
+                          f'{(time.perf_counter() - start) * 1000:.0f} мс')
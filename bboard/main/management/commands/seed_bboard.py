@@ -0,0 +1,204 @@
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import AdvUser, SuperRubric, SubRubric, Bb, \
+     AdditionalImage, Comment, Rating
+from main.pagecache import invalidate_bb_pages
+
+WORDS = (
+    'продам куплю новый б/у отличный состояние срочно недорого торг '
+    'велосипед телефон ноутбук диван шкаф стол стул холодильник машина '
+    'квартира комната дача гараж шины диски куртка пальто обувь книги '
+    'игрушки коляска кроватка телевизор планшет наушники часы сумка '
+    'доставка самовывоз гарантия документы оригинал комплект подарок '
+    'центр район метро рядом звоните пишите вечером выходные обмен '
+    'зимний летний детский мужской женский кожаный деревянный большой'
+).split()
+
+PASSWORD = 'password'
+
+
+def zipf_weights(count, exponent):
+    # Кумулятивные веса: несколько «горячих» элементов и длинный хвост
+    return list(accumulate(1 / (rank + 1) ** exponent
+                           for rank in range(count)))
+
+
+@contextmanager
+def explicit_dates(*fields):
+    # auto_now/auto_now_add перезаписали бы сгенерированные даты
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Начальное значение генератора')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--super-rubrics', type=int, default=5)
+        parser.add_argument('--rubrics', type=int, default=30,
+                            help='Количество подрубрик')
+        parser.add_argument('--bbs', type=int, default=100000)
+        parser.add_argument('--comments', type=float, default=3,
+                            help='Среднее число комментариев на объявление')
+        parser.add_argument('--ratings', type=float, default=2,
+                            help='Среднее число оценок на объявление')
+        parser.add_argument('--images', action='store_true',
+                            help='Добавлять изображения-заглушки')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--until', default='2025-01-01',
+                            help='Дата самого нового объявления (ГГГГ-ММ-ДД)')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределять объявления')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        start = time.perf_counter()
+        self.until = datetime.fromisoformat(options['until']) \
+                             .replace(tzinfo=timezone.utc)
+        users = self.create_users()
+        rubrics = self.create_rubrics()
+        images = self.create_images() if options['images'] else []
+        counts = self.create_bbs(users, rubrics, images)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: пользователей {}, рубрик {}, объявлений {}, '
+            'иллюстраций {}, комментариев {}, оценок {} за {:.1f} с'.format(
+                len(users), len(rubrics), *counts, elapsed)))
+        self.stdout.write(f'Пароль всех пользователей: {PASSWORD}')
+        if images:
+            self.stdout.write('Миниатюры: manage.py generate_thumbnails')
+
+    def create_users(self):
+        prefix = f'seed{self.options["seed"]}_'
+        password = make_password(PASSWORD)
+        AdvUser.objects.bulk_create(
+            [AdvUser(username=f'{prefix}{n}', email=f'{prefix}{n}@example.com',
+                     password=password, send_messages=False)
+             for n in range(self.options['users'])],
+            batch_size=self.options['batch_size'], ignore_conflicts=True)
+        return list(AdvUser.objects.filter(username__startswith=prefix)
+                                   .order_by('pk')
+                                   .values_list('pk', 'username'))
+
+    def create_rubrics(self):
+        rubrics = []
+        for s in range(self.options['super_rubrics']):
+            super_rubric, _ = SuperRubric.objects.get_or_create(
+                name=f'Раздел {s + 1}', defaults={'order': s})
+            rubrics.append(super_rubric)
+        subrubrics = []
+        for n in range(self.options['rubrics']):
+            subrubric, _ = SubRubric.objects.get_or_create(
+                name=f'Рубрика {n + 1}',
+                defaults={'order': n,
+                          'super_rubric': rubrics[n % len(rubrics)]})
+            subrubrics.append(subrubric.pk)
+        return subrubrics
+
+    def create_images(self):
+        from PIL import Image
+        names = []
+        for n in range(8):
+            buffer = io.BytesIO()
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            Image.new('RGB', (640, 480), color).save(buffer, 'JPEG')
+            names.append(default_storage.save(
+                f'seed/placeholder{n}.jpg', ContentFile(buffer.getvalue())))
+        return names
+
+    def text(self, low, high):
+        return ' '.join(self.rng.choices(
+            WORDS, cum_weights=self.word_weights,
+            k=self.rng.randint(low, high)))
+
+    def create_bbs(self, users, rubrics, images):
+        rng, options = self.rng, self.options
+        batch_size = options['batch_size']
+        self.word_weights = zipf_weights(len(WORDS), 1)
+        rubric_weights = zipf_weights(len(rubrics), options['skew'])
+        user_weights = zipf_weights(len(users), options['skew'])
+        span = options['days'] * 86400
+        counts = [0, 0, 0, 0]
+        fields = [Bb._meta.get_field('created_at'),
+                  Bb._meta.get_field('updated_at'),
+                  Comment._meta.get_field('created_at'),
+                  Rating._meta.get_field('created_at')]
+        with explicit_dates(*fields):
+            for offset in range(0, options['bbs'], batch_size):
+                size = min(batch_size, options['bbs'] - offset)
+                with transaction.atomic():
+                    self.create_batch(size, users, rubrics, images, span,
+                                      rubric_weights, user_weights, counts)
+                self.stdout.write(f'Объявлений: {counts[0]}')
+        return counts
+
+    def create_batch(self, size, users, rubrics, images, span,
+                     rubric_weights, user_weights, counts):
+        rng, options = self.rng, self.options
+        authors = rng.choices(users, cum_weights=user_weights, k=size)
+        bb_rubrics = rng.choices(rubrics, cum_weights=rubric_weights, k=size)
+        bbs, scores = [], []
+        for (author, _), rubric in zip(authors, bb_rubrics):
+            created_at = self.until - timedelta(seconds=rng.randrange(span))
+            bb_scores = {}
+            for _ in range(int(rng.expovariate(1 / options['ratings']))):
+                user = rng.choices(users, cum_weights=user_weights)[0][0]
+                bb_scores[user] = rng.randint(1, 5)
+            scores.append(bb_scores)
+            bbs.append(Bb(
+                rubric_id=rubric, author_id=author,
+                title=self.text(2, 4)[:40], content=self.text(10, 60),
+                price=round(rng.lognormvariate(8, 1.5), -1),
+                contacts=f'+7 9{rng.randrange(10 ** 9):09d}',
+                image=rng.choice(images) if images and rng.random() < .7
+                      else '',
+                created_at=created_at, updated_at=created_at,
+                ratings_count=len(bb_scores),
+                ratings_sum=sum(bb_scores.values())))
+        Bb.objects.bulk_create(bbs)
+        # bulk_create не отправляет post_save
+        transaction.on_commit(lambda: invalidate_bb_pages(set(bb_rubrics)))
+        additional, comments, ratings = [], [], []
+        for bb, bb_scores in zip(bbs, scores):
+            if images:
+                additional += [AdditionalImage(bb=bb, image=rng.choice(images))
+                               for _ in range(rng.randint(0, 3))]
+            for _ in range(int(rng.expovariate(1 / options['comments']))):
+                author = rng.choices(users, cum_weights=user_weights)[0][1]
+                comments.append(Comment(
+                    bb=bb, author=author, content=self.text(3, 30),
+                    created_at=bb.created_at +
+                               timedelta(seconds=rng.randrange(86400 * 7))))
+            ratings += [Rating(bb=bb, user_id=user, score=score,
+                               created_at=bb.created_at)
+                        for user, score in bb_scores.items()]
+        AdditionalImage.objects.bulk_create(additional)
+        Comment.objects.bulk_create(comments)
+        Rating.objects.bulk_create(ratings)
+        counts[0] += len(bbs)
+        counts[1] += len(additional)
+        counts[2] += len(comments)
+        counts[3] += len(ratings)
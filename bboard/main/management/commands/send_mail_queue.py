@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from main.models import OutgoingMail
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди исходящей почты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать очередь один раз и завершиться')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Пауза между проверками очереди, с')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Писем за одно SMTP-соединение')
+        parser.add_argument('--max-attempts', type=int, default=8,
+                            help='После стольких неудач письмо не отправляется')
+        parser.add_argument('--backoff', type=float, default=30,
+                            help='Начальная задержка повтора, с (удваивается)')
+        parser.add_argument('--lease', type=float, default=300,
+                            help='На сколько секунд письма пакета '
+                                 'закрепляются за процессом; должно быть '
+                                 'больше времени отправки пакета')
+
+    def handle(self, *args, **options):
+        # Процессов может быть несколько (на разных серверах, наложение
+        # запусков из cron): каждое письмо отправляет тот, кто его
+        # закрепил за собой (см. claim)
+        while True:
+            sent = self.send_batch(options)
+            if options['once'] and not sent:
+                break
+            if not sent:
+                time.sleep(options['interval'])
+
+    def send_batch(self, options):
+        now = timezone.now()
+        mails = list(OutgoingMail.objects.filter(
+            sent_at__isnull=True, next_attempt_at__lte=now,
+            attempts__lt=options['max_attempts']
+        )[:options['batch_size']])
+        mails = self.claim(mails, now + timedelta(seconds=options['lease']))
+        if not mails:
+            return 0
+        sent = 0
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as error:
+            for mail in mails:
+                self.fail(mail, error, now, options['backoff'])
+        else:
+            try:
+                for mail in mails:
+                    message = EmailMessage(mail.subject, mail.body,
+                                           settings.DEFAULT_FROM_EMAIL,
+                                           [mail.to], connection=connection)
+                    try:
+                        message.send()
+                    except Exception as error:
+                        self.fail(mail, error, now, options['backoff'])
+                    else:
+                        mail.sent_at = timezone.now()
+                        sent += 1
+            finally:
+                connection.close()
+        OutgoingMail.objects.bulk_update(
+            mails, ['sent_at', 'attempts', 'next_attempt_at', 'last_error'])
+        self.stdout.write(f'Отправлено писем: {sent} из {len(mails)}')
+        return len(mails)
+
+    def claim(self, mails, lease_until):
+        # Письмо закрепляется условным UPDATE: next_attempt_at переносится
+        # на lease_until, только если его еще никто не изменил. Другой
+        # процесс, выбравший то же письмо, получит 0 строк и пропустит
+        # его; письма процесса, завершившегося аварийно, снова станут
+        # доступны после lease_until
+        claimed = []
+        with transaction.atomic():
+            for mail in mails:
+                if OutgoingMail.objects.filter(
+                        pk=mail.pk, sent_at__isnull=True,
+                        next_attempt_at=mail.next_attempt_at
+                ).update(next_attempt_at=lease_until):
+                    mail.next_attempt_at = lease_until
+                    claimed.append(mail)
+        return claimed
+
+    def fail(self, mail, error, now, backoff):
+        mail.attempts += 1
+        mail.last_error = str(error)
+        mail.next_attempt_at = now + timedelta(
+            seconds=backoff * 2 ** (mail.attempts - 1))
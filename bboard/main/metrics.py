@@ -0,0 +1,210 @@
+import heapq
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import Template
+from django.utils.crypto import constant_time_compare
+
+# Метрики запросов: время обработки, число и время SQL-запросов, время
+# вывода шаблонов и размер ответа по каждому представлению. Хранятся
+# в гистограммах в памяти процесса и отдаются в текстовом формате
+# Prometheus по адресу /metrics/. Включаются настройкой METRICS_ENABLED;
+# если она выключена, MetricsMiddleware исключается из цепочки целиком
+
+logger = logging.getLogger('main.metrics')
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    'bboard_request_duration_seconds':
+        ('Время обработки запроса', TIME_BUCKETS),
+    'bboard_db_queries': ('Количество SQL-запросов', COUNT_BUCKETS),
+    'bboard_db_duration_seconds':
+        ('Суммарное время SQL-запросов', TIME_BUCKETS),
+    'bboard_template_render_seconds':
+        ('Время вывода шаблонов', TIME_BUCKETS),
+    'bboard_response_size_bytes': ('Размер ответа', SIZE_BUCKETS),
+}
+
+_current = ContextVar('bboard_request_stats', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.statuses = {}
+
+    def observe(self, view, stats, status):
+        values = {
+            'bboard_request_duration_seconds': stats.duration,
+            'bboard_db_queries': stats.queries,
+            'bboard_db_duration_seconds': stats.db_time,
+            'bboard_template_render_seconds': stats.render_time,
+            'bboard_response_size_bytes': stats.size,
+        }
+        with self.lock:
+            for name, value in values.items():
+                key = (name, view)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(METRICS[name][1])
+                self.histograms[key].observe(value)
+            key = (view, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets) in METRICS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, view), histogram in sorted(
+                        self.histograms.items()):
+                    if metric != name:
+                        continue
+                    label = f'view="{escape(view)}"'
+                    for bound, count in zip(buckets, histogram.counts):
+                        lines.append(
+                            f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} '
+                                 f'{histogram.total}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.total}')
+            lines.append('# HELP bboard_requests_total Количество запросов')
+            lines.append('# TYPE bboard_requests_total counter')
+            for (view, status), count in sorted(self.statuses.items()):
+                lines.append(f'bboard_requests_total{{view="{escape(view)}",'
+                             f'status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class RequestStats:
+    def __init__(self, keep_queries):
+        self.queries = 0
+        self.db_time = 0
+        self.render_time = 0
+        self.render_depth = 0
+        self.duration = 0
+        self.size = 0
+        self.keep_queries = keep_queries
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if self.keep_queries:
+                item = (elapsed, self.queries, sql)
+                if len(self.slowest) < self.keep_queries:
+                    heapq.heappush(self.slowest, item)
+                else:
+                    heapq.heappushpop(self.slowest, item)
+
+
+_original_render = Template.render
+
+def timed_render(self, context=None, request=None):
+    # Учитывается только внешний вызов: render_to_string внутри шаблона
+    # (например, {% include %} сторонних тегов) не считается дважды
+    stats = _current.get()
+    if stats is None:
+        return _original_render(self, context, request)
+    stats.render_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        stats.render_depth -= 1
+        if not stats.render_depth:
+            stats.render_time += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'METRICS_SLOW_REQUEST_MS', None)
+        self.slow_queries = getattr(settings, 'METRICS_SLOW_QUERIES', 3)
+        Template.render = timed_render
+
+    def __call__(self, request):
+        stats = RequestStats(self.slow_queries if self.slow_ms else 0)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        stats.duration = time.perf_counter() - start
+        if not response.streaming:
+            stats.size = len(response.content)
+        match = request.resolver_match
+        if match:
+            view = match.view_name or match._func_path
+        else:
+            view = 'unresolved'
+        registry.observe(view, stats, response.status_code)
+        if self.slow_ms and stats.duration * 1000 >= self.slow_ms:
+            self.log_slow_request(request, view, stats)
+        return response
+
+    def log_slow_request(self, request, view, stats):
+        queries = '\n'.join(
+            f'  [{elapsed * 1000:.1f} мс] {sql}'
+            for elapsed, number, sql in sorted(stats.slowest, reverse=True))
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.1f мс, SQL-запросов: %d '
+            '(%.1f мс), шаблоны: %.1f мс\n%s',
+            request.method, request.get_full_path(), view,
+            stats.duration * 1000, stats.queries, stats.db_time * 1000,
+            stats.render_time * 1000, queries)
+
+
+def metrics(request):
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        raise Http404
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (request.user.is_staff or token and
+            constant_time_compare(header, f'Bearer {token}')):
+        raise PermissionDenied
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.functional import SimpleLazyObject
+
 from .models import SubRubric
 
+# Дерево рубрик для панели навигации хранится в общем кэше под
+# ключом текущей версии (сама версия -- в кэше versions) и дополнительно в памяти процесса; версия
+# меняется сигналами при любом изменении рубрик, а кроме того
+# устаревает сама через RUBRICS_CACHE_TIMEOUT
+RUBRICS_VERSION_KEY = 'rubrics:version'
+RUBRICS_KEY = 'rubrics:%s'
+
+_local_rubrics = {}
+
+def get_rubrics_version():
+    return caches['versions'].get_or_set(RUBRICS_VERSION_KEY, time.time_ns,
+                                         settings.RUBRICS_CACHE_TIMEOUT)
+
+def get_rubrics():
+    version = get_rubrics_version()
+    if _local_rubrics.get('version') != version:
+        rubrics = cache.get(RUBRICS_KEY % version)
+        if rubrics is None:
+            rubrics = list(SubRubric.objects.select_related('super_rubric'))
+            cache.set(RUBRICS_KEY % version, rubrics,
+                      settings.RUBRICS_CACHE_TIMEOUT)
+        _local_rubrics.update(version=version, rubrics=rubrics)
+    return _local_rubrics['rubrics']
+
+def invalidate_rubrics():
+    caches['versions'].set(RUBRICS_VERSION_KEY, time.time_ns(),
+                           settings.RUBRICS_CACHE_TIMEOUT)
+    _local_rubrics.clear()
+
 def bboard_context_processor(request):
-    context = {'rubrics': SubRubric.objects.all()}
+    # Рубрики выбираются, только если шаблон действительно их выводит
+    context = {'rubrics': SimpleLazyObject(get_rubrics)}
     context['keyword'] = ''
     context['all'] = ''
     if 'keyword' in request.GET:
@@ -16,4 +52,10 @@ def bboard_context_processor(request):
                 context['all'] += '&page=' + page
             else:
                 context['all'] = '?page=' + page
+    if 'cursor' in request.GET:
+        cursor = request.GET['cursor']
+        if context['all']:
+            context['all'] += '&cursor=' + cursor
+        else:
+            context['all'] = '?cursor=' + cursor
     return context
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_ratings(apps, schema_editor):
+    Bb = apps.get_model('main', 'Bb')
+    Rating = apps.get_model('main', 'Rating')
+    ratings = Rating.objects.filter(bb=OuterRef('pk')).order_by().values('bb')
+    Bb.objects.using(schema_editor.connection.alias).update(
+        ratings_count=Coalesce(Subquery(
+            ratings.annotate(value=Count('pk')).values('value')), 0),
+        ratings_sum=Coalesce(Subquery(
+            ratings.annotate(value=Sum('score')).values('value')), 0),
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_alter_rubric_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bb',
+            name='ratings_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='bb',
+            name='ratings_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+
+CREATE_SQL = (
+    """CREATE VIRTUAL TABLE main_bb_fts USING fts5(
+        title, content, content='main_bb', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER main_bb_fts_ai AFTER INSERT ON main_bb BEGIN
+        INSERT INTO main_bb_fts(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER main_bb_fts_ad AFTER DELETE ON main_bb BEGIN
+        INSERT INTO main_bb_fts(main_bb_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER main_bb_fts_au AFTER UPDATE OF title, content
+    ON main_bb BEGIN
+        INSERT INTO main_bb_fts(main_bb_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO main_bb_fts(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+    "INSERT INTO main_bb_fts(main_bb_fts) VALUES ('rebuild')",
+)
+
+DROP_SQL = (
+    'DROP TRIGGER IF EXISTS main_bb_fts_ai',
+    'DROP TRIGGER IF EXISTS main_bb_fts_ad',
+    'DROP TRIGGER IF EXISTS main_bb_fts_au',
+    'DROP TABLE IF EXISTS main_bb_fts',
+)
+
+
+def create_fts(apps, schema_editor):
+    # Индекс создается только в SQLite, собранном с FTS5; в остальных
+    # случаях main.search переходит на поиск через icontains
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                for sql in CREATE_SQL:
+                    cursor.execute(sql)
+    except OperationalError:
+        pass
+
+
+def drop_fts(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_bb_ratings_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_bb_fts'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bb',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Объявление', 'verbose_name_plural': 'Объявления'},
+        ),
+    ]
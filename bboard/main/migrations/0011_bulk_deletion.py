@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:04
+
+from django.db import migrations, models
+import main.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_outgoingmail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Поставлен в очередь')),
+            ],
+            options={
+                'verbose_name': 'Файл к удалению',
+                'verbose_name_plural': 'Файлы к удалению',
+            },
+        ),
+        migrations.AlterModelManagers(
+            name='advuser',
+            managers=[
+                ('objects', main.models.AdvUserManager()),
+            ],
+        ),
+    ]
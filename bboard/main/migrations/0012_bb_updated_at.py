@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:06
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    Bb = apps.get_model('main', 'Bb')
+    Bb.objects.using(schema_editor.connection.alias) \
+              .update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_bulk_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bb',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменено'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
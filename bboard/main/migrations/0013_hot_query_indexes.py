@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_bb_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rubric', '-created_at', '-id'], name='main_bb_rubric_active'),
+        ),
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='main_bb_active'),
+        ),
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='main_bb_author_created'),
+        ),
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['updated_at', 'is_active'], name='main_bb_active_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rubric', 'updated_at', 'is_active'], name='main_bb_rubric_active_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['bb', 'created_at'], name='main_comment_bb_active'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['bb', 'id'], name='main_comment_bb_active_id'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+from django.db import migrations
+
+# «ё» в индексе заменяется на «е» (см. main.search.fold_yo). Триггеры
+# пересоздаются, индекс заполняется заново уже преобразованным текстом
+
+FOLD = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+DROP_TRIGGERS_SQL = (
+    'DROP TRIGGER IF EXISTS main_bb_fts_ai',
+    'DROP TRIGGER IF EXISTS main_bb_fts_ad',
+    'DROP TRIGGER IF EXISTS main_bb_fts_au',
+)
+
+FOLDED_SQL = (
+    f"""CREATE TRIGGER main_bb_fts_ai AFTER INSERT ON main_bb BEGIN
+        INSERT INTO main_bb_fts(rowid, title, content)
+        VALUES (new.id, {FOLD.format('new.title')},
+                {FOLD.format('new.content')});
+    END""",
+    f"""CREATE TRIGGER main_bb_fts_ad AFTER DELETE ON main_bb BEGIN
+        INSERT INTO main_bb_fts(main_bb_fts, rowid, title, content)
+        VALUES ('delete', old.id, {FOLD.format('old.title')},
+                {FOLD.format('old.content')});
+    END""",
+    f"""CREATE TRIGGER main_bb_fts_au AFTER UPDATE OF title, content
+    ON main_bb BEGIN
+        INSERT INTO main_bb_fts(main_bb_fts, rowid, title, content)
+        VALUES ('delete', old.id, {FOLD.format('old.title')},
+                {FOLD.format('old.content')});
+        INSERT INTO main_bb_fts(rowid, title, content)
+        VALUES (new.id, {FOLD.format('new.title')},
+                {FOLD.format('new.content')});
+    END""",
+    "INSERT INTO main_bb_fts(main_bb_fts) VALUES ('delete-all')",
+    f"""INSERT INTO main_bb_fts(rowid, title, content)
+    SELECT id, {FOLD.format('title')}, {FOLD.format('content')}
+    FROM main_bb""",
+)
+
+PLAIN_SQL = (
+    """CREATE TRIGGER main_bb_fts_ai AFTER INSERT ON main_bb BEGIN
+        INSERT INTO main_bb_fts(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER main_bb_fts_ad AFTER DELETE ON main_bb BEGIN
+        INSERT INTO main_bb_fts(main_bb_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER main_bb_fts_au AFTER UPDATE OF title, content
+    ON main_bb BEGIN
+        INSERT INTO main_bb_fts(main_bb_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO main_bb_fts(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+    "INSERT INTO main_bb_fts(main_bb_fts) VALUES ('rebuild')",
+)
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor != 'sqlite':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master "
+                           "WHERE type = 'table' AND name = 'main_bb_fts'")
+            if not cursor.fetchone():
+                return
+            for sql in DROP_TRIGGERS_SQL + statements:
+                cursor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_comment_since_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FOLDED_SQL), run(PLAIN_SQL)),
+    ]
@@ -1,9 +1,46 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+from collections import Counter
+
+from django.db import models, router, transaction
+from django.dispatch import Signal
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.contrib.auth import get_user_model
-from django.db.models import Avg
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from .utilities import get_timestamp_path
 
+# Отправляется после удаления объявлений через BbQuerySet.bulk_delete()
+# (обычный post_delete в этом случае не отправляется); rows — список
+# пар (ключ объявления, ключ рубрики)
+bbs_deleted = Signal()
+
+# Сколько ключей подставлять в один запрос DELETE ... WHERE IN (...)
+DELETE_CHUNK_SIZE = 500
+
+
+class AdvUserQuerySet(models.QuerySet):
+    def bulk_delete(self):
+        # Объявления и оценки пользователей удаляются пакетно, после
+        # чего в Collector остаются только сами пользователи
+        using = self._db or router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            users = list(self.values_list('pk', flat=True))
+            deleted = Counter(Bb.objects.using(using)
+                                        .filter(author__in=users)
+                                        .bulk_delete()[1])
+            ratings = Rating.objects.using(using).filter(user__in=users)
+            rated = list(ratings.values_list('bb', flat=True).distinct())
+            deleted[Rating._meta.label] += ratings._raw_delete(using)
+            Bb.objects.using(using).filter(pk__in=rated).rebuild_ratings()
+            deleted.update(self.model.objects.using(using)
+                                             .filter(pk__in=users).delete()[1])
+            return sum(deleted.values()), dict(deleted)
+
+
+class AdvUserManager(UserManager.from_queryset(AdvUserQuerySet)):
+    pass
+
+
 # Кастомная модель пользователя
 class AdvUser(AbstractUser):
     is_activated = models.BooleanField(
@@ -15,10 +52,10 @@ class AdvUser(AbstractUser):
         verbose_name='Слать оповещения о новых комментариях?'
     )
 
-    def delete(self, *args, **kwargs):
-        for bb in self.bb_set.all():
-            bb.delete()
-        super().delete(*args, **kwargs)
+    objects = AdvUserManager()
+
+    def delete(self, using=None, keep_parents=False):
+        return AdvUser.objects.using(using).filter(pk=self.pk).bulk_delete()
 
     class Meta(AbstractUser.Meta):
         pass
@@ -67,7 +104,9 @@ class SuperRubric(Rubric):
 # Менеджер для подрубрик
 class SubRubricManager(models.Manager):
     def get_queryset(self):
-        return super().get_queryset().filter(super_rubric__isnull=False)
+        # __str__ подрубрики выводит и название надрубрики
+        return super().get_queryset().filter(super_rubric__isnull=False) \
+                                     .select_related('super_rubric')
 
 
 # Прокси-модель: подрубрики
@@ -84,6 +123,65 @@ class SubRubric(Rubric):
         verbose_name_plural = 'Подрубрики'
 
 
+# Набор запросов для объявлений
+class BbQuerySet(models.QuerySet):
+    def rebuild_ratings(self):
+        # Пересчитывает счетчики оценок одним UPDATE с подзапросами
+        ratings = Rating.objects.filter(bb=OuterRef('pk')).order_by() \
+                                .values('bb')
+        count = ratings.annotate(value=Count('pk')).values('value')
+        total = ratings.annotate(value=Sum('score')).values('value')
+        return self.update(
+            ratings_count=Coalesce(Subquery(count), 0),
+            ratings_sum=Coalesce(Subquery(total), 0),
+            updated_at=timezone.now()
+        )
+
+    def touch(self):
+        # Отмечает объявления измененными (для условных GET-запросов)
+        return self.update(updated_at=timezone.now())
+
+    def with_user_score(self, user):
+        # Оценка текущего пользователя подтягивается в тот же запрос,
+        # что и сами объявления (None — пользователь еще не оценивал)
+        if not user.is_authenticated:
+            return self
+        score = Rating.objects.filter(bb=OuterRef('pk'), user=user.pk) \
+                              .values('score')[:1]
+        return self.annotate(user_score=Subquery(score))
+
+    def bulk_delete(self):
+        # Объявления удаляются вместе с иллюстрациями, комментариями и
+        # оценками несколькими запросами DELETE на каждые
+        # DELETE_CHUNK_SIZE объявлений, без загрузки записей в память
+        # и без сигналов на каждую строку. Файлы изображений ставятся
+        # в очередь StaleFile и удаляются командой purge_stale_files
+        using = self._db or router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            rows = list(self.values_list('pk', 'rubric', 'image'))
+            # Как и QuerySet.delete(), возвращается общее число удаленных
+            # записей и число записей каждой модели
+            deleted = Counter()
+            for start in range(0, len(rows), DELETE_CHUNK_SIZE):
+                chunk = rows[start:start + DELETE_CHUNK_SIZE]
+                pks = [pk for pk, rubric, image in chunk]
+                images = AdditionalImage.objects.using(using) \
+                                                .filter(bb__in=pks)
+                names = [image for pk, rubric, image in chunk if image]
+                names += images.values_list('image', flat=True)
+                StaleFile.objects.using(using).bulk_create(
+                    [StaleFile(name=name) for name in names])
+                for queryset in (images,
+                                 Comment.objects.filter(bb__in=pks),
+                                 Rating.objects.filter(bb__in=pks),
+                                 Bb.objects.filter(pk__in=pks)):
+                    deleted[queryset.model._meta.label] += \
+                        queryset.using(using)._raw_delete(using)
+        bbs_deleted.send(sender=Bb, using=using,
+                         rows=[(pk, rubric) for pk, rubric, image in rows])
+        return sum(deleted.values()), dict(deleted)
+
+
 # Модель объявления
 class Bb(models.Model):
     rubric = models.ForeignKey(SubRubric, on_delete=models.PROTECT, verbose_name='Рубрика')
@@ -95,22 +193,58 @@ class Bb(models.Model):
     author = models.ForeignKey(AdvUser, on_delete=models.CASCADE, verbose_name='Автор объявления')
     is_active = models.BooleanField(default=True, db_index=True, verbose_name='Выводить в списке?')
     created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Опубликовано')
+    # Меняется и при изменении комментариев, оценок и иллюстраций
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Изменено')
+    # Денормализованные счетчики оценок, поддерживаются сигналами Rating
+    ratings_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок')
+    ratings_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок')
 
-    def delete(self, *args, **kwargs):
-        for ai in self.additionalimage_set.all():
-            ai.delete()
-        super().delete(*args, **kwargs)
+    objects = BbQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Исходная рубрика нужна сигналам: при переносе объявления
+        # устаревают страницы обеих рубрик
+        instance._original_rubric_id = instance.__dict__.get('rubric_id')
+        return instance
+
+    def delete(self, using=None, keep_parents=False):
+        return Bb.objects.using(using).filter(pk=self.pk).bulk_delete()
 
     def average_rating(self):
-        return self.ratings.aggregate(Avg('score'))['score__avg'] or 0
+        if self.ratings_count:
+            return self.ratings_sum / self.ratings_count
+        return 0
 
     def rating_count(self):
-        return self.ratings.count()
+        return self.ratings_count
 
     class Meta:
         verbose_name = 'Объявление'
         verbose_name_plural = 'Объявления'
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        # Составные индексы под списки: выборка и сортировка по ним
+        # идут одним проходом по индексу, без сортировки в памяти
+        indexes = [
+            models.Index(fields=['rubric', '-created_at', '-id'],
+                         condition=models.Q(is_active=True),
+                         name='main_bb_rubric_active'),
+            models.Index(fields=['-created_at', '-id'],
+                         condition=models.Q(is_active=True),
+                         name='main_bb_active'),
+            models.Index(fields=['author', '-created_at', '-id'],
+                         name='main_bb_author_created'),
+            # Покрывающие индексы для агрегатов ETag (main.conditional);
+            # is_active включен в индекс, иначе SQLite обращается к
+            # таблице за значением из условия частичного индекса
+            models.Index(fields=['updated_at', 'is_active'],
+                         condition=models.Q(is_active=True),
+                         name='main_bb_active_updated'),
+            models.Index(fields=['rubric', 'updated_at', 'is_active'],
+                         condition=models.Q(is_active=True),
+                         name='main_bb_rubric_active_updated'),
+        ]
 
 
 # Дополнительные изображения
@@ -123,6 +257,19 @@ class AdditionalImage(models.Model):
         verbose_name_plural = 'Дополнительные иллюстрации'
 
 
+# Файлы удаленных записей, ожидающие удаления из хранилища
+class StaleFile(models.Model):
+    name = models.CharField(max_length=255, verbose_name='Имя файла')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Поставлен в очередь')
+
+    class Meta:
+        verbose_name = 'Файл к удалению'
+        verbose_name_plural = 'Файлы к удалению'
+
+    def __str__(self):
+        return self.name
+
+
 # Комментарии
 class Comment(models.Model):
     bb = models.ForeignKey(Bb, on_delete=models.CASCADE, verbose_name='Объявление')
@@ -135,6 +282,16 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['bb', 'created_at'],
+                         condition=models.Q(is_active=True),
+                         name='main_comment_bb_active'),
+            # Опрос новых комментариев (since_id в API). SQLite для него
+            # обходится индексом внешнего ключа: там это (bb_id, rowid)
+            models.Index(fields=['bb', 'id'],
+                         condition=models.Q(is_active=True),
+                         name='main_comment_bb_active_id'),
+        ]
 
 
 # Рейтинг (оценка)
@@ -149,10 +306,55 @@ class Rating(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходные значения, чтобы сигналы могли
+        # скорректировать счетчики объявления на разницу
+        instance._original = (instance.__dict__.get('bb_id'),
+                              instance.__dict__.get('score'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Сохранение оценки и обновление счетчиков — одна транзакция
+        using = kwargs.get('using') or router.db_for_write(Rating, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(Rating, instance=self)
+        with transaction.atomic(using=using):
+            return super().delete(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Рейтинг'
         verbose_name_plural = 'Рейтинги'
         unique_together = ('bb', 'user')
 
     def __str__(self):
-        return f'{self.user} → {self.bb.title}: {self.score}'
\ No newline at end of file
+        return f'{self.user} → {self.bb.title}: {self.score}'
+
+
+# Очередь исходящих писем (отправляет команда send_mail_queue)
+class OutgoingMail(models.Model):
+    to = models.EmailField(verbose_name='Получатель')
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Поставлено в очередь')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Неудачных попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['next_attempt_at'],
+                         condition=models.Q(sent_at__isnull=True),
+                         name='main_outgoingmail_pending'),
+        ]
+
+    def __str__(self):
+        return f'{self.to}: {self.subject}'
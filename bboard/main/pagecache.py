@@ -0,0 +1,127 @@
+import os
+import time
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.cache import get_conditional_response
+
+from .conditional import has_messages
+from .middleware import get_rubrics_version
+
+# Кэш страниц со списками объявлений (главная, рубрики) для посетителей
+# без входа. Копия страницы хранится под ключом полного адреса (вместе
+# с keyword, page, cursor) и помечена версиями: дерева рубрик (оно
+# выводится на каждой странице) и группы страниц -- главной или одной
+# рубрики. Сигналы меняют версию только затронутых групп.
+# Копия считается устаревшей, если изменилась версия или прошло
+# PAGE_CACHE_TIMEOUT секунд, но хранится еще PAGE_STALE_TIMEOUT секунд.
+# Страницу (и устаревшую, и отсутствующую в кэше) выводит один процесс,
+# захвативший блокировку (файл в CACHE_LOCKS_DIR); остальные в это
+# время отдают устаревшую копию, а если ее нет -- выводят страницу,
+# не сохраняя ее. Версии хранятся в отдельном кэше versions, из которого
+# они не вытесняются копиями страниц
+
+PAGES_VERSION_KEY = 'pages:version:%s'
+PAGE_KEY = 'page:%s'
+
+# Сколько секунд хранится версия группы страниц
+PAGES_VERSION_TIMEOUT = 24 * 60 * 60
+
+# Сколько секунд устаревшая копия еще может отдаваться, пока страница
+# выводится заново
+PAGE_STALE_TIMEOUT = 60
+
+# Сколько секунд блокировка пересборки держится, если пересобиравший
+# процесс завершился аварийно
+PAGE_LOCK_TIMEOUT = 30
+
+def get_group_version(group):
+    return caches['versions'].get_or_set(PAGES_VERSION_KEY % group, time.time_ns,
+                                         PAGES_VERSION_TIMEOUT)
+
+def invalidate_pages(*groups):
+    version = time.time_ns()
+    caches['versions'].set_many({PAGES_VERSION_KEY % group: version for group in groups},
+                                PAGES_VERSION_TIMEOUT)
+
+def invalidate_bb_pages(rubrics):
+    # Объявления выводятся на главной и на страницах своих рубрик
+    invalidate_pages('index', *('rubric:%s' % pk for pk in rubrics
+                                if pk is not None))
+
+def acquire_lock(name):
+    # cache.add() файлового кэша -- это has_key() и set(), так что
+    # блокировку могли бы получить сразу два процесса. Файл же
+    # создается атомарно (O_CREAT | O_EXCL). Возвращает путь к файлу
+    # блокировки или None, если она занята
+    os.makedirs(settings.CACHE_LOCKS_DIR, exist_ok=True)
+    path = os.path.join(settings.CACHE_LOCKS_DIR, name + '.lock')
+    for attempt in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) < PAGE_LOCK_TIMEOUT:
+                    return None
+                # Блокировка осталась от аварийно завершившегося процесса
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return None
+
+def release_lock(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def is_cacheable(request, response):
+    # Страница с cookie (например, CSRF-токен, выведенный в шаблоне)
+    # принадлежит одному посетителю
+    return response.status_code == 200 and not response.streaming \
+        and not response.cookies \
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+
+def anonymous_page_cache(get_group):
+    # get_group получает параметры представления и возвращает имя группы
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.PAGE_CACHE_TIMEOUT or request.method != 'GET' \
+               or request.user.is_authenticated or has_messages(request):
+                return view(request, *args, **kwargs)
+            digest = md5(request.get_full_path().encode()).hexdigest()
+            key = PAGE_KEY % digest
+            version = (get_rubrics_version(),
+                       get_group_version(get_group(*args, **kwargs)))
+            entry = cache.get(key)
+            if entry is not None:
+                entry_version, expires, response = entry
+                if entry_version == version and time.time() < expires:
+                    return get_conditional_response(
+                        request, etag=response.get('ETag'),
+                        response=response)
+            lock = acquire_lock('page-' + digest)
+            if lock is None:
+                if entry is not None:
+                    return get_conditional_response(
+                        request, etag=response.get('ETag'),
+                        response=response)
+                return view(request, *args, **kwargs)
+            try:
+                response = view(request, *args, **kwargs)
+                # Версия взята до вывода страницы: если данные изменились
+                # за это время, копия сразу окажется устаревшей
+                if is_cacheable(request, response):
+                    cache.set(key, (version,
+                                    time.time() + settings.PAGE_CACHE_TIMEOUT,
+                                    response),
+                              settings.PAGE_CACHE_TIMEOUT + PAGE_STALE_TIMEOUT)
+            finally:
+                release_lock(lock)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,178 @@
+import base64
+import json
+from hashlib import md5
+from math import ceil
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# Постраничный вывод по ключу (created_at, id), совпадающему с
+# Bb.Meta.ordering: следующая страница выбирается условием
+# «старше последней записи», а не OFFSET, поэтому не замедляется
+# с ростом номера страницы
+
+def encode_cursor(bb, number, backward=False):
+    data = [bb.created_at.isoformat(), bb.pk, number, int(backward)]
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk, number, backward = json.loads(raw)
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            return None
+        return created_at, int(pk), max(int(number), 1), bool(backward)
+    except (TypeError, ValueError):
+        return None
+
+
+class CursorPage:
+    def __init__(self, object_list, number, paginator,
+                 has_next, has_previous):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<CursorPage %s>' % self.number
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return encode_cursor(self.object_list[-1], self.number + 1)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return encode_cursor(self.object_list[0], self.number - 1,
+                                 backward=True)
+        return None
+
+
+class CursorPaginator:
+    ordering = ('-created_at', '-pk')
+
+    def __init__(self, object_list, per_page, count_timeout=60):
+        self.object_list = object_list.order_by(*self.ordering)
+        self.per_page = int(per_page)
+        self.count_timeout = count_timeout
+
+    def _count_key(self):
+        try:
+            sql = str(self.object_list.query)
+        except EmptyResultSet:
+            return None
+        return 'paginator-count:%s:%s' % (
+            self.object_list.db, md5(sql.encode()).hexdigest())
+
+    @cached_property
+    def count(self):
+        # Точное количество нужно только для номеров страниц, поэтому
+        # оно считается по требованию и кэшируется на count_timeout секунд
+        key = self._count_key()
+        if key is None:
+            return 0
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, self.count_timeout)
+        return count
+
+    async def acount(self):
+        if 'count' not in self.__dict__:
+            key = self._count_key()
+            count = await cache.aget(key) if key else 0
+            if count is None:
+                count = await self.object_list.acount()
+                await cache.aset(key, count, self.count_timeout)
+            self.__dict__['count'] = count
+        return self.count
+
+    @property
+    def num_pages(self):
+        return max(ceil(self.count / self.per_page), 1)
+
+    def get_page(self, cursor=None, number=None):
+        position = decode_cursor(cursor) if cursor else None
+        if position:
+            return self._keyset_page(*position)
+        try:
+            number = int(number or 1)
+        except (TypeError, ValueError):
+            number = 1
+        if number > 1:
+            return self._offset_page(min(number, self.num_pages))
+        return self._keyset_page(None, None, 1, False)
+
+    async def aget_page(self, cursor=None):
+        # Для асинхронных представлений: только переход по курсору
+        position = decode_cursor(cursor) if cursor else None
+        created_at, pk, number, backward = position or (None, None, 1, False)
+        qs = self._keyset_queryset(created_at, pk, backward)
+        rows = [row async for row in qs[:self.per_page + 1]]
+        return self._keyset_result(rows, created_at, number, backward)
+
+    def _keyset_page(self, created_at, pk, number, backward):
+        qs = self._keyset_queryset(created_at, pk, backward)
+        rows = list(qs[:self.per_page + 1])
+        return self._keyset_result(rows, created_at, number, backward)
+
+    def _keyset_queryset(self, created_at, pk, backward):
+        qs = self.object_list
+        # Избыточное условие по одному created_at позволяет SQLite
+        # начать просмотр индекса сразу с нужного места: по условию
+        # с OR индекс используется только для сортировки
+        if backward:
+            qs = qs.filter(Q(created_at__gt=created_at) |
+                           Q(created_at=created_at, pk__gt=pk),
+                           created_at__gte=created_at) \
+                   .order_by('created_at', 'pk')
+        elif created_at is not None:
+            qs = qs.filter(Q(created_at__lt=created_at) |
+                           Q(created_at=created_at, pk__lt=pk),
+                           created_at__lte=created_at)
+        return qs
+
+    def _keyset_result(self, rows, created_at, number, backward):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backward:
+            rows.reverse()
+            return CursorPage(rows, number, self, True, has_more)
+        return CursorPage(rows, number, self, has_more,
+                          created_at is not None)
+
+    def _offset_page(self, number):
+        # Переход по номеру страницы (ссылки bootstrap_pagination);
+        # дальнейшая навигация «вперед/назад» идет уже по курсору
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], number, self, has_next,
+                          True)
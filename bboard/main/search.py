@@ -0,0 +1,113 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Полнотекстовый индекс FTS5 по названию и описанию объявлений
+# (создается миграцией 0008_bb_fts и поддерживается триггерами)
+FTS_TABLE = 'main_bb_fts'
+
+# unicode61 не считает «ё» вариантом «е» (remove_diacritics касается
+# только латиницы), а пишут «е» вместо «ё» постоянно. Поэтому «ё»
+# заменяется на «е» и в индексируемом тексте, и в запросе
+def fold_yo(text):
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+def fold_yo_sql(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+# Триггеры, поддерживающие индекс в актуальном состоянии. При удалении
+# передаются те же (преобразованные) значения, что были проиндексированы
+FTS_TRIGGERS = (
+    (f'{FTS_TABLE}_ai',
+     f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON main_bb
+     BEGIN
+         INSERT INTO {FTS_TABLE}(rowid, title, content)
+         VALUES (new.id, {fold_yo_sql('new.title')},
+                 {fold_yo_sql('new.content')});
+     END"""),
+    (f'{FTS_TABLE}_ad',
+     f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON main_bb
+     BEGIN
+         INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+         VALUES ('delete', old.id, {fold_yo_sql('old.title')},
+                 {fold_yo_sql('old.content')});
+     END"""),
+    (f'{FTS_TABLE}_au',
+     f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+     AFTER UPDATE OF title, content ON main_bb BEGIN
+         INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+         VALUES ('delete', old.id, {fold_yo_sql('old.title')},
+                 {fold_yo_sql('old.content')});
+         INSERT INTO {FTS_TABLE}(rowid, title, content)
+         VALUES (new.id, {fold_yo_sql('new.title')},
+                 {fold_yo_sql('new.content')});
+     END"""),
+)
+
+# Перестроение индекса. Команда 'rebuild' взяла бы текст из main_bb
+# без замены «ё», поэтому индекс очищается и заполняется заново
+FTS_REBUILD = (
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')",
+    f"""INSERT INTO {FTS_TABLE}(rowid, title, content)
+    SELECT id, {fold_yo_sql('title')}, {fold_yo_sql('content')} FROM main_bb""",
+)
+
+_fts_tables = {}
+
+def fts_available(using):
+    if using not in _fts_tables:
+        connection = connections[using]
+        _fts_tables[using] = connection.vendor == 'sqlite' and \
+            FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[using]
+
+def fts_query(keyword):
+    # Каждое слово — префиксный запрос в кавычках, чтобы символы
+    # из пользовательского ввода не разбирались как синтаксис FTS5
+    return ' '.join('"%s"*' % word
+                    for word in re.findall(r'\w+', fold_yo(keyword)))
+
+def search_bbs(queryset, keyword, ranked=False):
+    if not fts_available(queryset.db):
+        q = Q(title__icontains=keyword) | Q(content__icontains=keyword)
+        return queryset.filter(q)
+    query = fts_query(keyword)
+    if not query:
+        return queryset.none()
+    matches = RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (query,))
+    queryset = queryset.filter(pk__in=matches)
+    if ranked:
+        # bm25: совпадение в названии весит больше, чем в описании
+        rank = RawSQL(
+            f'SELECT bm25({FTS_TABLE}, 5.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = main_bb.id',
+            (query,))
+        queryset = queryset.annotate(search_rank=rank) \
+                           .order_by('search_rank', '-created_at')
+    return queryset
+
+def repair_fts_triggers(using):
+    # Многие изменения схемы SQLite выполняет через пересоздание таблицы,
+    # и триггеры main_bb при этом теряются. Они восстанавливаются после
+    # каждой миграции, а индекс перестраивается заново
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                       "AND name = %s", [FTS_TABLE])
+        if not cursor.fetchone():
+            return
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                       "AND tbl_name = 'main_bb'")
+        existing = {row[0] for row in cursor.fetchall()}
+        if all(name in existing for name, sql in FTS_TRIGGERS):
+            return
+        for name, sql in FTS_TRIGGERS:
+            cursor.execute(sql)
+        for sql in FTS_REBUILD:
+            cursor.execute(sql)
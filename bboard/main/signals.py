@@ -1,7 +1,17 @@
+from functools import partial
+
 from django.dispatch import Signal, receiver
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.utils import timezone
 
-from .models import Comment
+from .models import Bb, AdditionalImage, Comment, Rating, Rubric, \
+     SuperRubric, SubRubric, bbs_deleted
+from .middleware import invalidate_rubrics
+from .pagecache import invalidate_bb_pages
+from .thumbnails import schedule_thumbnails
+from .search import repair_fts_triggers
 from .utilities import send_activation_notification, \
      send_new_comment_notification
 
@@ -13,6 +23,79 @@ def post_register_dispatcher(sender, **kwargs):
 
 @receiver(post_save, sender=Comment)
 def post_save_dispatcher(sender, **kwargs):
-    author = kwargs['instance'].bb.author
-    if kwargs['created'] and author.send_messages:
+    if kwargs['created'] and kwargs['instance'].bb.author.send_messages:
         send_new_comment_notification(kwargs['instance'])
+
+
+def change_ratings(using, bb_id, count, total):
+    Bb.objects.using(using).filter(pk=bb_id).update(
+        ratings_count=F('ratings_count') + count,
+        ratings_sum=F('ratings_sum') + total,
+        updated_at=timezone.now()
+    )
+
+@receiver(post_save, sender=Rating)
+def rating_post_save_dispatcher(sender, instance, created, using, **kwargs):
+    old_bb_id, old_score = getattr(instance, '_original', (None, None))
+    if created:
+        change_ratings(using, instance.bb_id, 1, instance.score)
+    elif old_bb_id is None or old_score is None:
+        # Исходная оценка неизвестна — пересчитываем счетчики объявления
+        Bb.objects.using(using).filter(pk=instance.bb_id).rebuild_ratings()
+    elif old_bb_id != instance.bb_id:
+        change_ratings(using, old_bb_id, -1, -old_score)
+        change_ratings(using, instance.bb_id, 1, instance.score)
+    elif old_score != instance.score:
+        change_ratings(using, instance.bb_id, 0, instance.score - old_score)
+    instance._original = (instance.bb_id, instance.score)
+
+@receiver(post_delete, sender=Rating)
+def rating_post_delete_dispatcher(sender, instance, using, **kwargs):
+    old_bb_id, old_score = getattr(instance, '_original', (None, None))
+    change_ratings(using, old_bb_id or instance.bb_id, -1,
+                   -(old_score or instance.score))
+
+@receiver(post_save, sender=Rubric)
+@receiver(post_save, sender=SuperRubric)
+@receiver(post_save, sender=SubRubric)
+@receiver(post_delete, sender=Rubric)
+@receiver(post_delete, sender=SuperRubric)
+@receiver(post_delete, sender=SubRubric)
+def rubric_changed_dispatcher(sender, using, **kwargs):
+    # Новая версия дерева рубрик делает устаревшими и все копии страниц
+    # (см. main/pagecache.py): панель навигации есть на каждой
+    transaction.on_commit(invalidate_rubrics, using=using)
+
+@receiver(post_save, sender=Bb)
+@receiver(post_delete, sender=Bb)
+def bb_changed_dispatcher(sender, instance, using, **kwargs):
+    # Объявление, перенесенное в другую рубрику, пропадает со страниц
+    # прежней
+    rubrics = {instance.rubric_id, getattr(instance, '_original_rubric_id',
+                                           None)}
+    instance._original_rubric_id = instance.rubric_id
+    transaction.on_commit(partial(invalidate_bb_pages, rubrics), using=using)
+
+@receiver(bbs_deleted)
+def bbs_deleted_dispatcher(sender, using, rows, **kwargs):
+    rubrics = {rubric for pk, rubric in rows}
+    transaction.on_commit(partial(invalidate_bb_pages, rubrics), using=using)
+
+@receiver(post_save, sender=Bb)
+@receiver(post_save, sender=AdditionalImage)
+def image_post_save_dispatcher(sender, instance, using, **kwargs):
+    if instance.image:
+        transaction.on_commit(partial(schedule_thumbnails, instance.image),
+                              using=using)
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=AdditionalImage)
+@receiver(post_delete, sender=AdditionalImage)
+def bb_child_changed_dispatcher(sender, instance, using, **kwargs):
+    Bb.objects.using(using).filter(pk=instance.bb_id).touch()
+
+@receiver(post_migrate)
+def post_migrate_dispatcher(sender, app_config, using, **kwargs):
+    if app_config.name == 'main':
+        repair_fts_triggers(using)
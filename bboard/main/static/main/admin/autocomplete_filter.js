@@ -0,0 +1,15 @@
+'use strict';
+{
+    const $ = django.jQuery;
+    // Выбор значения в фильтре с автодополнением сразу применяет отбор
+    $(document).on('change', '.autocomplete-filter select', function() {
+        const filter = this.closest('.autocomplete-filter');
+        let url = filter.dataset.queryString;
+        if (this.value) {
+            url += (url.endsWith('?') ? '' : '&') +
+                   encodeURIComponent(filter.dataset.parameter) + '=' +
+                   encodeURIComponent(this.value);
+        }
+        window.location.href = url;
+    });
+}
@@ -0,0 +1,118 @@
+import datetime
+
+from django import template
+from django.db.models import Min
+from django.utils import formats, timezone
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+register = template.Library()
+
+# Замена тега date_hierarchy из django.contrib.admin. Стандартный тег
+# получает годы, месяцы и дни через QuerySet.dates(), то есть
+# SELECT DISTINCT по всем записям выборки. Здесь каждый следующий
+# период ищется как MIN(поле) начиная с конца предыдущего: один поиск
+# по индексу на каждый выводимый период
+
+
+def truncate(value, kind):
+    value = value.replace(day=1) if kind != 'day' else value
+    if kind == 'year':
+        value = value.replace(month=1)
+    if isinstance(value, datetime.datetime):
+        value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value
+
+
+def period_end(value, kind):
+    if kind == 'year':
+        end = value.replace(year=value.year + 1)
+    elif kind == 'month':
+        end = (value + datetime.timedelta(days=32)).replace(day=1)
+    else:
+        end = value + datetime.timedelta(days=1)
+    if isinstance(end, datetime.datetime) and timezone.is_aware(end):
+        # Переход на летнее время меняет смещение
+        end = timezone.make_aware(end.replace(tzinfo=None))
+    return end
+
+
+def distinct_periods(queryset, field_name, kind):
+    queryset = queryset.order_by()
+    periods = []
+    start = None
+    while True:
+        bounded = queryset.filter(**{f'{field_name}__gte': start}) \
+            if start is not None else queryset
+        value = bounded.aggregate(value=Min(field_name))['value']
+        if value is None:
+            return periods
+        if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+            value = timezone.localtime(value)
+        period = truncate(value, kind)
+        periods.append(period)
+        start = period_end(period, kind)
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def indexed_date_hierarchy(cl):
+    # Вывод и ссылки -- как у стандартного тега
+    field_name = cl.date_hierarchy
+    year_field = f'{field_name}__year'
+    month_field = f'{field_name}__month'
+    day_field = f'{field_name}__day'
+    year_lookup = cl.params.get(year_field)
+    month_lookup = cl.params.get(month_field)
+    day_lookup = cl.params.get(day_field)
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__'])
+
+    if year_lookup and month_lookup and day_lookup:
+        day = datetime.date(int(year_lookup), int(month_lookup),
+                            int(day_lookup))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year_lookup,
+                              month_field: month_lookup}),
+                'title': capfirst(formats.date_format(day,
+                                                      'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(
+                formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+        }
+    if year_lookup and month_lookup:
+        days = distinct_periods(cl.queryset, field_name, 'day')
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year_lookup}),
+                     'title': str(year_lookup)},
+            'choices': [{
+                'link': link({year_field: year_lookup,
+                              month_field: month_lookup, day_field: day.day}),
+                'title': capfirst(formats.date_format(day,
+                                                      'MONTH_DAY_FORMAT')),
+            } for day in days],
+        }
+    if year_lookup:
+        months = distinct_periods(cl.queryset, field_name, 'month')
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [{
+                'link': link({year_field: year_lookup,
+                              month_field: month.month}),
+                'title': capfirst(formats.date_format(month,
+                                                      'YEAR_MONTH_FORMAT')),
+            } for month in months],
+        }
+    years = distinct_periods(cl.queryset, field_name, 'year')
+    return {
+        'show': True,
+        'back': None,
+        'choices': [{
+            'link': link({year_field: str(year.year)}),
+            'title': str(year.year),
+        } for year in years],
+    }
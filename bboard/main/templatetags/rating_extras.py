@@ -3,13 +3,18 @@ from ..models import Rating
 
 register = template.Library()
 
+# Если объявление получено через Bb.objects.with_user_score(),
+# оценка берется из памяти, иначе выполняется запрос к базе
+def get_user_score(user, bb):
+    if hasattr(bb, 'user_score'):
+        return bb.user_score or 0
+    return Rating.objects.filter(user=user, bb=bb) \
+                         .values_list('score', flat=True).first() or 0
+
 @register.filter
 def has_rated(user, bb):
-    return Rating.objects.filter(user=user, bb=bb).exists()
+    return get_user_score(user, bb) > 0
 
 @register.simple_tag
 def user_rating_score(user, bb):
-    try:
-        return Rating.objects.get(user=user, bb=bb).score
-    except Rating.DoesNotExist:
-        return 0
\ No newline at end of file
+    return get_user_score(user, bb)
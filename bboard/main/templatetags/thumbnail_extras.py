@@ -0,0 +1,8 @@
+from django import template
+from ..thumbnails import get_thumbnail_url
+
+register = template.Library()
+
+@register.filter
+def thumbnail_src(fieldfile, alias):
+    return get_thumbnail_url(fieldfile, alias)
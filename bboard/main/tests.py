@@ -1,3 +1,650 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from hashlib import md5
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from captcha.models import CaptchaStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, \
+     override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.tokens import default_token_generator
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from easy_thumbnails.files import get_thumbnailer
+from rest_framework.authtoken.models import Token
+
+from bboard.routers import STICKY_COOKIE, ReplicaRoutingMiddleware, \
+     replica_reads
+
+from .management.commands.send_mail_queue import \
+     Command as SendMailQueueCommand
+from .models import AdvUser, SuperRubric, SubRubric, Bb, AdditionalImage, \
+     Comment, Rating, OutgoingMail
+from .pagecache import PAGE_KEY, PAGE_LOCK_TIMEOUT, acquire_lock, \
+     release_lock
+from .search import search_bbs, repair_fts_triggers
+from .thumbnails import get_thumbnail_url
+from .utilities import signer
+
+
+@override_settings(PASSWORD_HASHERS=[
+    'django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTestCase(TestCase):
+    # Каждая страница запрашивается при малом и большом объеме данных:
+    # число SQL-запросов не должно зависеть от количества записей
+    # (иначе где-то в представлении или шаблоне прячется N+1)
+    # и не должно превышать бюджет из BUDGETS
+    sizes = (1, 6)
+    BUDGETS = {}
+
+    def setUp(self):
+        cache.clear()
+        caches['versions'].clear()
+        self.user = AdvUser.objects.create_user(
+            username='owner', password='password', email='owner@example.com')
+        self.users = []
+        self.rubrics = []
+        self.bb = None
+        self.size = 0
+
+    def grow(self, size):
+        # Доводит объем данных до size по всем измерениям сразу
+        if size <= self.size:
+            return
+        for n in range(self.size, size):
+            self.users.append(AdvUser.objects.create_user(
+                username=f'user{n}', password='password'))
+            super_rubric = SuperRubric.objects.create(name=f'Раздел {n}')
+            self.rubrics.append(SubRubric.objects.create(
+                name=f'Рубрика {n}', super_rubric=super_rubric))
+        rubric = self.rubrics[0]
+        while Bb.objects.filter(rubric=rubric).count() < size:
+            bb = Bb.objects.create(
+                rubric=rubric, author=self.user, title='Продам велосипед',
+                content='Горный велосипед', contacts='+7 900 000-00-00')
+            if self.bb is None:
+                self.bb = bb
+        for n in range(self.size, size):
+            AdditionalImage.objects.create(bb=self.bb, image=f'ai{n}.jpg')
+            Comment.objects.create(bb=self.bb, author=f'user{n}',
+                                   content='Комментарий')
+            Rating.objects.create(bb=self.bb, user=self.users[n], score=4)
+        self.size = size
+
+    def count_queries(self, method, url, data=None, user=None):
+        self.client.logout()
+        if user:
+            self.client.force_login(user)
+        # Первый запрос прогревает кэши (рубрики, миниатюры и т. п.)
+        getattr(self.client, method)(url, data)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                # Записи выбираются по мере отдачи ответа
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500, url)
+        return [query['sql'] for query in queries]
+
+    def assertQueryBudget(self, name, url, method='get', data=None,
+                          user=None):
+        counts = []
+        for size in self.sizes:
+            self.grow(size)
+            queries = self.count_queries(
+                method, url() if callable(url) else url,
+                data() if callable(data) else data, user)
+            counts.append(len(queries))
+        budget = self.BUDGETS.get(name)
+        if len(set(counts)) > 1 or budget is not None and counts[-1] > budget:
+            self.fail(self.describe(name, counts, budget, queries))
+
+    def describe(self, name, counts, budget, queries):
+        lines = [f'{name}: SQL-запросов {counts} при объеме данных '
+                 f'{list(self.sizes)} (бюджет: {budget})']
+        shapes = Counter(re.sub(r'\b\d+\b', '?', sql) for sql in queries)
+        for sql, count in shapes.most_common():
+            lines.append(f'  {count} x {sql}')
+        return '\n'.join(lines)
+
+
+class MainQueryBudgetTests(QueryBudgetTestCase):
+    BUDGETS = {
+        'index': 2,
+        'other': 0,
+        'rubric_bbs': 3,
+        'rubric_bbs_keyword': 3,
+        'bb_detail_guest': 4,
+        'bb_detail_guest_comment': 4,
+        'bb_detail_user': 5,
+        'add_rating': 8,
+        'profile': 2,
+        'profile_bb_detail': 4,
+        'profile_bb_edit': 4,
+        'profile_bb_delete': 2,
+        'profile_edit': 2,
+        'profile_delete': 2,
+        'password_edit': 1,
+        'profile_bb_add': 2,
+        'password_reset_confirm': 4,
+        'activate': 1,
+        'admin_bb': 5,
+        'admin_comment': 3,
+        'admin_rating': 3,
+        'admin_bb_filtered': 6,
+    }
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_index(self):
+        self.assertQueryBudget('index', '/')
+
+    def test_other_page(self):
+        self.assertQueryBudget('other', reverse('main:other',
+                                                kwargs={'page': 'about'}))
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_rubric_bbs(self):
+        self.assertQueryBudget('rubric_bbs', lambda: reverse(
+            'main:rubric_bbs', kwargs={'pk': self.rubrics[0].pk}))
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_rubric_bbs_keyword(self):
+        self.assertQueryBudget('rubric_bbs_keyword', lambda: reverse(
+            'main:rubric_bbs', kwargs={'pk': self.rubrics[0].pk}) +
+            '?keyword=велосипед')
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_rubric_bbs_pagination(self):
+        # Номера страниц выводятся по количеству из кэша; после перехода
+        # по номеру навигация идет по курсору
+        self.grow(6)
+        url = reverse('main:rubric_bbs', kwargs={'pk': self.rubrics[0].pk})
+        self.assertContains(self.client.get(url), 'page=3')
+        response = self.client.get(url + '?page=2')
+        self.assertEqual(response.context['page'].number, 2)
+        cursor = response.context['page'].next_cursor
+        self.assertContains(response, 'cursor=' + cursor)
+        response = self.client.get(url + '?cursor=' + cursor)
+        self.assertEqual(response.context['page'].number, 3)
+        self.assertFalse(response.context['page'].has_next())
+
+    def test_anonymous_page_cache(self):
+        self.grow(2)
+        index = '/'
+        rubric = reverse('main:rubric_bbs', kwargs={'pk': self.rubrics[0].pk})
+        other = reverse('main:rubric_bbs', kwargs={'pk': self.rubrics[1].pk})
+        for url in (index, rubric, rubric + '?keyword=велосипед', other):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                self.client.get(url)
+        # Изменение объявления затрагивает только главную и его рубрику
+        with self.captureOnCommitCallbacks(execute=True):
+            Bb.objects.filter(pk=self.bb.pk).update(title='Продам самокат')
+            Bb.objects.get(pk=self.bb.pk).save()
+        with self.assertNumQueries(0):
+            self.client.get(other)
+        self.assertContains(self.client.get(index), 'Продам самокат')
+        self.assertContains(self.client.get(rubric), 'Продам самокат')
+        # Пока страницу пересобирает другой процесс, отдается старая копия
+        with self.captureOnCommitCallbacks(execute=True):
+            Bb.objects.filter(pk=self.bb.pk).update(title='Продам ролики')
+            Bb.objects.get(pk=self.bb.pk).save()
+        lock = acquire_lock('page-' + md5(index.encode()).hexdigest())
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(index), 'Продам самокат')
+        release_lock(lock)
+        self.assertContains(self.client.get(rubric), 'Продам ролики')
+        # Пользователю после входа страница выводится заново
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(index), 'Продам самокат')
+
+    def test_anonymous_page_cache_lock(self):
+        self.grow(1)
+        url = reverse('main:rubric_bbs', kwargs={'pk': self.rubrics[0].pk})
+        digest = md5(url.encode()).hexdigest()
+        key = PAGE_KEY % digest
+        # Пока страницу выводит другой процесс, а копии еще нет, страница
+        # выводится, но не сохраняется
+        lock = acquire_lock('page-' + digest)
+        self.assertIsNone(acquire_lock('page-' + digest))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIsNone(cache.get(key))
+        release_lock(lock)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        # Копия, хранящаяся дольше PAGE_CACHE_TIMEOUT, устарела: ее отдают,
+        # только пока страницу выводит другой процесс
+        version, expires, response = cache.get(key)
+        cache.set(key, (version, time.time() - 1, response))
+        lock = acquire_lock('page-' + digest)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        release_lock(lock)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        # Блокировку, оставшуюся от аварийно завершившегося процесса,
+        # забирает другой процесс
+        lock = acquire_lock('page-' + digest)
+        moment = time.time() - PAGE_LOCK_TIMEOUT - 1
+        os.utime(lock, (moment, moment))
+        self.assertEqual(acquire_lock('page-' + digest), lock)
+        release_lock(lock)
+
+    def test_bb_detail_guest(self):
+        self.assertQueryBudget('bb_detail_guest', lambda: reverse(
+            'main:bb_detail', kwargs={'rubric_pk': self.rubrics[0].pk,
+                                      'pk': self.bb.pk}))
+
+    def test_bb_detail_guest_read_only(self):
+        # Гость, который только читает, ничего не пишет в базу
+        self.grow(1)
+        queries = self.count_queries('get', reverse(
+            'main:bb_detail', kwargs={'rubric_pk': self.rubrics[0].pk,
+                                      'pk': self.bb.pk}))
+        self.assertEqual([sql for sql in queries
+                          if not sql.startswith('SELECT')], [])
+
+    def test_bb_detail_guest_comment(self):
+        # Форма с CAPTCHA берет задание из пула, не создавая нового
+        call_command('captcha_pool_worker', size=3, stdout=StringIO())
+        self.assertQueryBudget('bb_detail_guest_comment', lambda: reverse(
+            'main:bb_detail', kwargs={'rubric_pk': self.rubrics[0].pk,
+                                      'pk': self.bb.pk}) + '?comment=1')
+        self.assertEqual(CaptchaStore.objects.count(), 3)
+
+    def test_guest_comment_without_session(self):
+        # Сообщение о добавленном комментарии передается в cookie:
+        # гостю сессия не создается и таблица django_session не читается
+        self.grow(1)
+        call_command('captcha_pool_worker', size=1, stdout=StringIO())
+        captcha = CaptchaStore.objects.get()
+        url = reverse('main:bb_detail', kwargs={
+            'rubric_pk': self.rubrics[0].pk, 'pk': self.bb.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {
+                'comment_submit': '1', 'bb': self.bb.pk, 'author': 'Гость',
+                'content': 'Отзыв', 'captcha_0': captcha.hashkey,
+                'captcha_1': captcha.response}, follow=True)
+        self.assertContains(response, 'Комментарий добавлен')
+        self.assertNotIn('sessionid', self.client.cookies)
+        self.assertFalse([query['sql'] for query in queries
+                          if 'django_session' in query['sql']])
+
+    def test_bb_detail_post_without_etag(self):
+        self.grow(1)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('main:bb_detail', kwargs={
+                'rubric_pk': self.rubrics[0].pk, 'pk': self.bb.pk}),
+                {'comment_submit': '1', 'bb': self.bb.pk, 'content': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query['sql'] for query in queries
+                          if query['sql'].startswith(
+                              'SELECT "main_bb"."updated_at"')])
+
+    def test_bb_detail_user(self):
+        self.assertQueryBudget('bb_detail_user', lambda: reverse(
+            'main:bb_detail', kwargs={'rubric_pk': self.rubrics[0].pk,
+                                      'pk': self.bb.pk}), user=self.user)
+
+    def test_profile(self):
+        self.assertQueryBudget('profile', reverse('main:profile'),
+                               user=self.user)
+
+    def test_profile_bb_detail(self):
+        self.assertQueryBudget('profile_bb_detail', lambda: reverse(
+            'main:profile_bb_detail', kwargs={'pk': self.bb.pk}),
+            user=self.user)
+
+    def test_profile_bb_edit(self):
+        self.assertQueryBudget('profile_bb_edit', lambda: reverse(
+            'main:profile_bb_edit', kwargs={'pk': self.bb.pk}),
+            user=self.user)
+
+    def test_profile_bb_delete(self):
+        self.assertQueryBudget('profile_bb_delete', lambda: reverse(
+            'main:profile_bb_delete', kwargs={'pk': self.bb.pk}),
+            user=self.user)
+
+    def test_delete_counts(self):
+        # Как и QuerySet.delete(), удаление возвращает число записей
+        self.grow(2)
+        total, deleted = self.bb.delete()
+        self.assertEqual(total, 7)
+        self.assertEqual(deleted, {'main.AdditionalImage': 2,
+                                   'main.Comment': 2, 'main.Rating': 2,
+                                   'main.Bb': 1})
+        total, deleted = self.user.delete()
+        self.assertEqual(total, 2)
+        self.assertEqual(deleted['main.Bb'], 1)
+        self.assertEqual(deleted['main.AdvUser'], 1)
+
+    def test_static_pages(self):
+        # Страницы, не зависящие от объема данных: бюджет общий
+        user_pages = ('profile_edit', 'profile_delete', 'password_edit',
+                      'profile_bb_add')
+        guest_pages = ('register', 'register_done', 'login',
+                       'password_reset', 'password_reset_done',
+                       'password_reset_complete', 'test_403')
+        for name in user_pages:
+            with self.subTest(name):
+                self.assertQueryBudget(name, reverse('main:' + name),
+                                       user=self.user)
+        for name in guest_pages:
+            with self.subTest(name):
+                self.assertQueryBudget(name, reverse('main:' + name))
+
+    def test_account_links(self):
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        token = default_token_generator.make_token(self.user)
+        self.assertQueryBudget('password_reset_confirm', reverse(
+            'main:password_reset_confirm',
+            kwargs={'uidb64': uid, 'token': token}))
+        self.assertQueryBudget('activate', reverse(
+            'main:activate', kwargs={'sign': signer.sign('owner')}))
+
+    def test_add_rating(self):
+        self.assertQueryBudget('add_rating', lambda: reverse(
+            'main:add_rating', kwargs={'rubric_pk': self.rubrics[0].pk,
+                                       'pk': self.bb.pk}),
+            method='post', data={'score': 5}, user=self.user)
+
+    def test_logout(self):
+        self.assertQueryBudget('logout', reverse('main:logout'),
+                               method='post', user=self.user)
+
+    def test_admin_changelists(self):
+        admin = AdvUser.objects.create_superuser(
+            username='admin', password='password', email='admin@example.com')
+        for name, url in (('admin_bb', '/admin/main/bb/'),
+                          ('admin_comment', '/admin/main/comment/'),
+                          ('admin_rating', '/admin/main/rating/')):
+            self.assertQueryBudget(name, url, user=admin)
+        self.assertQueryBudget('admin_bb_filtered', lambda: (
+            f'/admin/main/bb/?created_at__year={self.bb.created_at.year}'
+            f'&author__id__exact={self.user.pk}'), user=admin)
+        # Без отбора число записей оценивается без COUNT(*), годы для
+        # date_hierarchy выбираются без SELECT DISTINCT
+        queries = self.count_queries('get', '/admin/main/bb/', user=admin)
+        self.assertFalse([sql for sql in queries
+                          if 'COUNT(' in sql or 'DISTINCT' in sql])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        user = AdvUser.objects.create_user(username='owner',
+                                           password='password')
+        super_rubric = SuperRubric.objects.create(name='Раздел')
+        rubric = SubRubric.objects.create(name='Рубрика',
+                                          super_rubric=super_rubric)
+        self.bbs = {title: Bb.objects.create(
+            rubric=rubric, author=user, title=title, content=content,
+            contacts='+7 900 000-00-00')
+            for title, content in (('Елка', 'Искусственная'),
+                                   ('Ёлка', 'Живая'),
+                                   ('Игрушки', 'На ЁЛКУ и гирлянды'))}
+
+    def search(self, keyword):
+        return set(search_bbs(Bb.objects.all(), keyword)
+                   .values_list('title', flat=True))
+
+    def test_yo_and_case(self):
+        # «ё» и «е», строчные и прописные буквы не различаются
+        for keyword in ('елка', 'ёлка', 'ЁЛКА', 'Елка'):
+            self.assertEqual(self.search(keyword), {'Елка', 'Ёлка'}, keyword)
+        for keyword in ('ёлк', 'ЕЛК', 'елку'):
+            self.assertIn('Игрушки', self.search(keyword), keyword)
+        self.assertEqual(self.search('ЕЛК'), {'Елка', 'Ёлка', 'Игрушки'})
+        self.assertEqual(self.search('живая'), {'Ёлка'})
+
+    def test_triggers(self):
+        bb = self.bbs['Игрушки']
+        bb.content = 'Шары на ёлку'
+        bb.save()
+        self.assertEqual(self.search('шары елку'), {'Игрушки'})
+        self.assertEqual(self.search('гирлянды'), set())
+        self.bbs['Ёлка'].delete()
+        self.assertEqual(self.search('елк'), {'Елка', 'Игрушки'})
+        # Перестроение индекса (repair_fts_triggers) тоже заменяет «ё»
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER main_bb_fts_ai')
+        repair_fts_triggers(connection.alias)
+        self.assertEqual(self.search('ЁЛК'), {'Елка', 'Игрушки'})
+
+
+# SimpleTestCase не оборачивает тест в транзакцию, а внутри транзакции
+# маршрутизатор и так читает с основной базы
+class ReplicaRouterTests(SimpleTestCase):
+    def test_outside_request(self):
+        self.assertEqual(router.db_for_read(Bb), 'default')
+
+    def test_plain_read(self):
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Bb), 'readonly')
+
+    def test_read_after_write(self):
+        with replica_reads() as state:
+            self.assertEqual(router.db_for_write(Bb), 'default')
+            self.assertTrue(state.wrote)
+            self.assertEqual(router.db_for_read(Bb), 'default')
+
+    def test_primary_apps(self):
+        with replica_reads() as state:
+            for model in (CaptchaStore, Session, Token):
+                self.assertEqual(router.db_for_read(model), 'default')
+                router.db_for_write(model)
+            # Запись капчи или сессии не переводит клиента на default
+            self.assertFalse(state.wrote)
+            self.assertEqual(router.db_for_read(Bb), 'readonly')
+
+    def test_sticky_cookie(self):
+        def view(request):
+            response = HttpResponse()
+            response.db = router.db_for_read(Bb)
+            if request.method == 'POST':
+                router.db_for_write(Bb)
+            return response
+
+        middleware = ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.get('/'))
+        self.assertEqual(response.db, 'readonly')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        response = middleware(factory.post('/'))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        # Запрос с cookie читает с основной базы, пока она не истекла
+        request = factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        self.assertEqual(middleware(request).db, 'default')
+        request = factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = str(int(time.time()) - 1)
+        self.assertEqual(middleware(request).db, 'readonly')
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        AdvUser.objects.create_user(username='owner', password='password')
+        super_rubric = SuperRubric.objects.create(name='Раздел')
+        self.bikes, self.scooters = (
+            SubRubric.objects.create(name=name, super_rubric=super_rubric)
+            for name in ('Велосипеды', 'Самокаты'))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        media = override_settings(MEDIA_ROOT=os.path.join(self.dir, 'media'))
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def import_records(self, *records):
+        path = os.path.join(self.dir, 'bbs.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(dict(record, content='Описание',
+                                           contacts='+7 900 000-00-00'))
+                           + '\n')
+        call_command('import_bbs', path, author='owner', restart=True,
+                     stdout=StringIO(), stderr=StringIO())
+
+    def test_rubric_by_name(self):
+        # Ключ рубрики из другой базы не должен совпасть с нашим
+        self.import_records(
+            {'title': 'Велосипед', 'rubric': self.scooters.pk,
+             'rubric_name': 'Велосипеды'},
+            {'title': 'Самокат', 'rubric': self.scooters.pk},
+            {'title': 'Ролики', 'rubric': self.bikes.pk,
+             'rubric_name': 'Ролики'})
+        self.assertEqual(dict(Bb.objects.values_list('title', 'rubric')),
+                         {'Велосипед': self.bikes.pk,
+                          'Самокат': self.scooters.pk})
+
+    def test_failed_batch_deletes_images(self):
+        from PIL import Image
+        Image.new('RGB', (1, 1)).save(os.path.join(self.dir, 'bike.png'))
+        with mock.patch.object(Bb.objects, 'bulk_create',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.import_records({'title': 'Велосипед',
+                                     'rubric_name': 'Велосипеды',
+                                     'image': 'bike.png'})
+        self.assertEqual([name for root, dirs, names
+                          in os.walk(os.path.join(self.dir, 'media'))
+                          for name in names], [])
+        self.import_records({'title': 'Велосипед',
+                             'rubric_name': 'Велосипеды',
+                             'image': 'bike.png'})
+        self.assertTrue(Bb.objects.get().image.storage.exists(
+            Bb.objects.get().image.name))
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_missing_thumbnail(self):
+        # Пока миниатюры нет, выводится исходное изображение, а миниатюра
+        # ставится в очередь один раз
+        image = Bb(image='bb.jpg').image
+        with mock.patch('main.thumbnails.schedule_thumbnails') as schedule, \
+             mock.patch('main.thumbnails.get_thumbnailer',
+                        wraps=get_thumbnailer) as thumbnailer:
+            for _ in range(3):
+                self.assertEqual(get_thumbnail_url(image, 'default'),
+                                 image.url)
+        schedule.assert_called_once_with(image)
+        self.assertEqual(thumbnailer.call_count, 1)
+
+
+@override_settings(PASSWORD_HASHERS=[
+    'django.contrib.auth.hashers.MD5PasswordHasher'])
+class RatingCounterTests(TestCase):
+    # Счетчики ratings_count и ratings_sum объявления должны совпадать
+    # с подсчетом по самим оценкам при любом изменении оценок
+    def setUp(self):
+        self.users = [AdvUser.objects.create_user(username=f'user{n}',
+                                                  password='password')
+                      for n in range(3)]
+        super_rubric = SuperRubric.objects.create(name='Раздел')
+        rubric = SubRubric.objects.create(name='Рубрика',
+                                          super_rubric=super_rubric)
+        self.bbs = [Bb.objects.create(
+            rubric=rubric, author=self.users[0], title=f'Объявление {n}',
+            content='Описание', contacts='+7 900 000-00-00')
+            for n in range(2)]
+
+    def assertCounters(self):
+        for bb in Bb.objects.all():
+            expected = Rating.objects.filter(bb=bb).aggregate(
+                count=Count('pk'), total=Coalesce(Sum('score'), 0))
+            self.assertEqual((bb.ratings_count, bb.ratings_sum),
+                             (expected['count'], expected['total']), bb)
+
+    def rate(self, bb, user, score):
+        return Rating.objects.update_or_create(
+            bb=bb, user=user, defaults={'score': score})[0]
+
+    def test_create(self):
+        self.rate(self.bbs[0], self.users[1], 4)
+        self.rate(self.bbs[0], self.users[2], 5)
+        self.assertCounters()
+        self.assertEqual(Bb.objects.get(pk=self.bbs[0].pk).ratings_sum, 9)
+
+    def test_change_score(self):
+        self.rate(self.bbs[0], self.users[1], 4)
+        self.rate(self.bbs[0], self.users[1], 2)
+        self.assertCounters()
+        self.assertEqual(Bb.objects.get(pk=self.bbs[0].pk).ratings_count, 1)
+
+    def test_move_to_other_bb(self):
+        rating = self.rate(self.bbs[0], self.users[1], 4)
+        rating = Rating.objects.get(pk=rating.pk)
+        rating.bb = self.bbs[1]
+        rating.score = 3
+        rating.save()
+        self.assertCounters()
+
+    def test_delete(self):
+        self.rate(self.bbs[0], self.users[1], 4)
+        rating = self.rate(self.bbs[0], self.users[2], 5)
+        Rating.objects.get(pk=rating.pk).delete()
+        self.assertCounters()
+
+    def test_delete_user(self):
+        for bb in self.bbs:
+            self.rate(bb, self.users[1], 4)
+            self.rate(bb, self.users[2], 1)
+        self.users[2].delete()
+        self.assertCounters()
+        self.assertEqual(Bb.objects.get(pk=self.bbs[1].pk).ratings_sum, 4)
+
+
+class MailQueueTests(TestCase):
+    def setUp(self):
+        for n in range(3):
+            OutgoingMail.objects.create(to=f'user{n}@example.com',
+                                        subject='Тема', body='Текст')
+
+    def send(self):
+        call_command('send_mail_queue', once=True, stdout=StringIO())
+
+    def test_send(self):
+        self.send()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutgoingMail.objects.filter(sent_at__isnull=True))
+        self.send()
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_claim(self):
+        # Второй процесс, выбравший те же письма, не получает их
+        command = SendMailQueueCommand()
+        lease_until = timezone.now() + timedelta(minutes=5)
+        first = list(OutgoingMail.objects.all())
+        second = list(OutgoingMail.objects.all())
+        self.assertEqual(len(command.claim(first, lease_until)), 3)
+        self.assertEqual(command.claim(second, lease_until), [])
+        self.send()
+        self.assertEqual(mail.outbox, [])
+        # Письма аварийно завершившегося процесса отправляются после
+        # истечения срока закрепления
+        OutgoingMail.objects.update(next_attempt_at=timezone.now())
+        self.send()
+        self.assertEqual(len(mail.outbox), 3)
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.files import get_thumbnailer
+
+# Миниатюры для всех THUMBNAIL_ALIASES создаются сразу после сохранения
+# изображения в фоновом пуле потоков, а шаблоны получают готовые адреса
+# из кэша и не обращаются к хранилищу при выводе страницы
+
+# Сколько секунд после постановки в очередь создание миниатюры
+# не запускается повторно
+THUMBNAIL_PENDING_TIMEOUT = 60
+
+_executor = None
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+            thread_name_prefix='thumbnails')
+    return _executor
+
+def get_cache_key(alias, name):
+    return f'thumbnail:{alias}:{name}'
+
+def generate_thumbnails(fieldfile):
+    try:
+        thumbnailer = get_thumbnailer(fieldfile)
+        for alias, options in aliases.all(fieldfile).items():
+            # Параметры из aliases.all() -- общие словари настроек,
+            # поэтому они не изменяются
+            thumbnail = thumbnailer.get_thumbnail(dict(options, ALIAS=alias))
+            cache.set(get_cache_key(alias, fieldfile.name), thumbnail.url,
+                      None)
+    finally:
+        close_old_connections()
+
+def schedule_thumbnails(fieldfile):
+    get_executor().submit(generate_thumbnails, fieldfile)
+
+def get_thumbnail_url(fieldfile, alias):
+    key = get_cache_key(alias, fieldfile.name)
+    pending_key = key + ':pending'
+    found = cache.get_many([key, pending_key])
+    if key in found:
+        return found[key]
+    if pending_key not in found:
+        thumbnailer = get_thumbnailer(fieldfile)
+        options = aliases.get(alias, target=thumbnailer.alias_target)
+        thumbnail = thumbnailer.get_existing_thumbnail(options)
+        if thumbnail is not None:
+            cache.set(key, thumbnail.url, None)
+            return thumbnail.url
+        # Миниатюры нет (например, объявления добавлены bulk_create
+        # без post_save или задание пропало при остановке процесса):
+        # она создается в фоне, а пока выводится исходное изображение.
+        # Хранилище в это время повторно не проверяется
+        cache.set(pending_key, 1, THUMBNAIL_PENDING_TIMEOUT)
+        schedule_thumbnails(fieldfile)
+    return fieldfile.url
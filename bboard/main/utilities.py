@@ -14,7 +14,7 @@ def send_activation_notification(user):
     context = {'user': user, 'host': host, 'sign': signer.sign(user.username)}
     subject = render_to_string('email/activation_letter_subject.txt', context)
     body_text = render_to_string('email/activation_letter_body.txt', context)
-    user.email_user(subject, body_text)
+    queue_mail(user.email, subject, body_text)
 
 def get_timestamp_path(instance, filename):
     return '%s%s' % (datetime.now().timestamp(), splitext(filename)[1])
@@ -28,4 +28,10 @@ def send_new_comment_notification(comment):
     context = {'author': author, 'host': host, 'comment': comment}
     subject = render_to_string('email/new_comment_letter_subject.txt', context)
     body_text = render_to_string('email/new_comment_letter_body.txt', context)
-    author.email_user(subject, body_text)
+    queue_mail(author.email, subject, body_text)
+
+def queue_mail(to, subject, body):
+    # Письмо только записывается в очередь; отправкой по SMTP
+    # занимается команда send_mail_queue
+    from .models import OutgoingMail
+    OutgoingMail.objects.create(to=to, subject=subject.strip(), body=body)
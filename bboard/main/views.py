@@ -14,22 +14,26 @@ from django.urls import reverse_lazy
 from django.views.generic.base import TemplateView
 from django.core.signing import BadSignature
 from django.contrib.auth import logout
-from django.core.paginator import Paginator
-from django.db.models import Q
 from django.contrib import messages
 from django.shortcuts import get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import condition
 
 from .models import AdvUser,  SubRubric, Bb, Comment
 from .forms import ProfileEditForm, RegisterForm, SearchForm, \
      BbForm, AIFormSet, UserCommentForm, GuestCommentForm, RatingForm
 from .utilities import signer
+from .search import search_bbs
+from .pagination import CursorPaginator
+from .conditional import bbs_etag, bb_etag
+from .pagecache import anonymous_page_cache
 from django.shortcuts import render
 
 def test_403(request):
     return render(request, '403.html', status=403)
 
 
+@anonymous_page_cache(lambda: 'index')
+@condition(etag_func=bbs_etag)
 def index(request):
     bbs = Bb.objects.filter(is_active=True).select_related('rubric')[:10]
     context = {'bbs': bbs}
@@ -48,7 +52,9 @@ class BBLoginView(LoginView):
 @login_required
 def profile(request):
     bbs = Bb.objects.filter(author=request.user.pk)
-    context = {'bbs': bbs}
+    paginator = CursorPaginator(bbs, 10)
+    page = paginator.get_page(request.GET.get('cursor'))
+    context = {'page': page, 'bbs': page.object_list}
     return render(request, 'main/profile.html', context)
 
 class BBLogoutView(LogoutView):
@@ -92,7 +98,7 @@ def user_activate(request, sign):
         return render(request, 'main/activation_failed.html')
     user = get_object_or_404(AdvUser, username=username)
     if user.is_activated:
-        template = 'main/activation_done_later.html'
+        template = 'main/activation_done_earlier.html'
     else:
         template = 'main/activation_done.html'
         user.is_active = True
@@ -139,28 +145,26 @@ class BBPasswordResetCompleteView(PasswordResetCompleteView):
 def test_500(request):
     raise Exception("Тестовая ошибка 500")
 
+@anonymous_page_cache(lambda pk: 'rubric:%s' % pk)
+@condition(etag_func=bbs_etag)
 def rubric_bbs(request, pk):
     rubric = get_object_or_404(SubRubric, pk=pk)
     bbs = Bb.objects.filter(is_active=True, rubric=pk)
-    if 'keyword' in request.GET:
-        keyword = request.GET['keyword']
-        q = Q(title__icontains=keyword) | Q(content__icontains=keyword)
-        bbs = bbs.filter(q)
-    else:
-        keyword = ''
+    keyword = request.GET.get('keyword', '')
+    if keyword:
+        bbs = search_bbs(bbs, keyword)
     form = SearchForm(initial={'keyword': keyword})
-    paginator = Paginator(bbs, 2)
-    if 'page' in request.GET:
-        page_num = request.GET['page']
-    else:
-        page_num = 1
-    page = paginator.get_page(page_num)
+    paginator = CursorPaginator(bbs, 2)
+    page = paginator.get_page(request.GET.get('cursor'),
+                              request.GET.get('page'))
     context = {'rubric': rubric, 'page': page, 'bbs': page.object_list,
                'form': form}
     return render(request, 'main/rubric_bbs.html', context)
 
+@condition(etag_func=bb_etag)
 def bb_detail(request, rubric_pk, pk):
-    bb = get_object_or_404(Bb, pk=pk)
+    bb = get_object_or_404(Bb.objects.select_related('rubric')
+                             .with_user_score(request.user), pk=pk)
     ais = bb.additionalimage_set.all()
     comments = Comment.objects.filter(bb=pk, is_active=True)
 
@@ -172,7 +176,12 @@ def bb_detail(request, rubric_pk, pk):
     else:
         comment_form_class = GuestCommentForm
 
-    comment_form = comment_form_class(initial=initial)
+    # Гостю форма с CAPTCHA выводится, только когда он решил оставить
+    # комментарий (?comment=1): иначе просмотр объявления ничего
+    # не пишет в базу и не требует вывода картинки
+    comment_form = None
+    if request.user.is_authenticated or 'comment' in request.GET:
+        comment_form = comment_form_class(initial=initial)
 
     if request.method == 'POST' and 'comment_submit' in request.POST:
         c_form = comment_form_class(request.POST)
@@ -192,7 +201,7 @@ def bb_detail(request, rubric_pk, pk):
         if request.method == 'POST' and 'rating_submit' in request.POST:
             r_form = RatingForm(request.POST)
             if r_form.is_valid():
-                rating, created = bb.rating_set.update_or_create(
+                rating, created = bb.ratings.update_or_create(
                     user=request.user,
                     defaults={'score': r_form.cleaned_data['score']}
                 )
@@ -214,7 +223,7 @@ def bb_detail(request, rubric_pk, pk):
 
 @login_required
 def profile_bb_detail(request, pk):
-    bb = get_object_or_404(Bb, pk=pk)
+    bb = get_object_or_404(Bb.objects.select_related('rubric'), pk=pk)
     ais = bb.additionalimage_set.all()
     comments = Comment.objects.filter(bb=pk, is_active=True)
     context = {'bb': bb, 'ais': ais, 'comments': comments}